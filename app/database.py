@@ -26,3 +26,13 @@ users_collection = db["users"]
 auth_collection = db["auth"]
 scans_collection = db["scans"]
 # Add more collections as needed
+
+
+async def ensure_indexes():
+    # /scan/my-scans: filter by owner, keyset-paginate on (uploaded_at, _id)
+    await scans_collection.create_index(
+        [("user_email", 1), ("uploaded_at", -1), ("_id", -1)],
+        name="user_email_uploaded_at_id",
+    )
+    # admin bulk export across users walks scans newest first
+    await scans_collection.create_index([("uploaded_at", -1)], name="uploaded_at")
@@ -0,0 +1,250 @@
+"""
+SHAP / occlusion explanations for uploaded scans, run through the durable job
+queue (app/utils/job_queue.py) instead of per-request background tasks.
+
+Uploads call enqueue_explanation(); one job per scan id. The job only carries
+the scan id and the prediction-cache key, and the image is read back from
+GridFS, so a job survives API restarts and can be picked up by any worker:
+
+    EXPLAIN_WORKER_MODE=inline     # default: the API process runs the workers
+    EXPLAIN_WORKER_MODE=external   # the API only enqueues; run workers separately:
+    python -m app.explain_jobs
+"""
+import asyncio
+import os
+
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from app.database import db, scans_collection
+from app.utils.explanation_store import EXPLANATION_KINDS, pack_explanations, explanation_update, has_explanation
+from app.utils.http_client import HttpClientPool, CircuitBreaker
+from app.utils.image_store import load_scan_image
+from app.utils.job_queue import JobWorker, MongoJobStore, MemoryJobStore
+from app.utils.prediction_cache import prediction_cache
+from app.utils.pubsub import events, PUBSUB_BACKEND
+from app.utils.thread_executor import run_in_thread, run_in_explain_thread
+
+load_dotenv()
+
+SHAP_MICROSERVICE_URL = os.getenv("SHAP_MICROSERVICE_URL", "http://localhost:8001/explain")
+OCCL_MICROSERVICE_URL = os.getenv("OCCL_MICROSERVICE_URL", "http://localhost:8002/explain")
+SHAP_BACKEND = os.getenv("SHAP_BACKEND", "service").lower()  # "service" or "local"
+OCCLUSION_BACKEND = os.getenv("OCCLUSION_BACKEND", "service").lower()  # "service" or "local"
+
+EXPLAIN_QUEUE_BACKEND = os.getenv("EXPLAIN_QUEUE_BACKEND", "mongo").lower()  # "mongo" or "memory"
+EXPLAIN_WORKER_MODE = os.getenv("EXPLAIN_WORKER_MODE", "inline").lower()  # "inline" or "external"
+EXPLAIN_WORKER_CONCURRENCY = int(os.getenv("EXPLAIN_WORKER_CONCURRENCY", "2"))
+EXPLAIN_MAX_ATTEMPTS = int(os.getenv("EXPLAIN_MAX_ATTEMPTS", "5"))
+EXPLAIN_BACKOFF_BASE_S = float(os.getenv("EXPLAIN_BACKOFF_BASE_S", "5"))
+EXPLAIN_BACKOFF_MAX_S = float(os.getenv("EXPLAIN_BACKOFF_MAX_S", "300"))
+EXPLAIN_JOB_LEASE_S = float(os.getenv("EXPLAIN_JOB_LEASE_S", "300"))
+EXPLAIN_POLL_INTERVAL_S = float(os.getenv("EXPLAIN_POLL_INTERVAL_S", "1"))
+
+EXPLAIN_HTTP_POOL_SIZE = int(os.getenv("EXPLAIN_HTTP_POOL_SIZE", "32"))
+EXPLAIN_HTTP_KEEPALIVE_S = float(os.getenv("EXPLAIN_HTTP_KEEPALIVE_S", "30"))
+EXPLAIN_CONNECT_TIMEOUT_S = float(os.getenv("EXPLAIN_CONNECT_TIMEOUT_S", "3"))
+SHAP_READ_TIMEOUT_S = float(os.getenv("SHAP_READ_TIMEOUT_S", "60"))
+OCCL_READ_TIMEOUT_S = float(os.getenv("OCCL_READ_TIMEOUT_S", "30"))
+EXPLAIN_HTTP_RETRIES = int(os.getenv("EXPLAIN_HTTP_RETRIES", "2"))
+EXPLAIN_HTTP_BACKOFF_S = float(os.getenv("EXPLAIN_HTTP_BACKOFF_S", "0.5"))
+EXPLAIN_BREAKER_FAILURES = int(os.getenv("EXPLAIN_BREAKER_FAILURES", "5"))
+EXPLAIN_BREAKER_RESET_S = float(os.getenv("EXPLAIN_BREAKER_RESET_S", "30"))
+
+# one keep-alive session per process, shared by every explanation job
+explain_http = HttpClientPool(limit=EXPLAIN_HTTP_POOL_SIZE, keepalive_timeout_s=EXPLAIN_HTTP_KEEPALIVE_S)
+
+
+def _service(name: str, url: str, read_timeout_s: float):
+    return explain_http.service(
+        name, url,
+        connect_timeout_s=EXPLAIN_CONNECT_TIMEOUT_S,
+        read_timeout_s=read_timeout_s,
+        retries=EXPLAIN_HTTP_RETRIES,
+        backoff_s=EXPLAIN_HTTP_BACKOFF_S,
+        breaker=CircuitBreaker(EXPLAIN_BREAKER_FAILURES, EXPLAIN_BREAKER_RESET_S),
+    )
+
+
+explain_services = {
+    "shap": _service("shap", SHAP_MICROSERVICE_URL, SHAP_READ_TIMEOUT_S),
+    "occlusion": _service("occlusion", OCCL_MICROSERVICE_URL, OCCL_READ_TIMEOUT_S),
+}
+
+
+class ExplanationIncomplete(Exception):
+    pass
+
+
+def scan_channel(scan_id: str) -> str:
+    """Pub/sub channel on which explanation progress for one scan is announced."""
+    return f"scan:{scan_id}"
+
+
+async def _publish(scan_id: str, status: str, ready: dict):
+    message = {"scan_id": scan_id, "status": status, "ready": ready}
+    try:
+        await events.publish(scan_channel(scan_id), message)
+    except Exception as e:
+        # a lost notification must not fail (and retry) an otherwise finished job
+        print(f"[ERROR] Could not publish explanation event for {scan_id}: {e}")
+
+
+async def _announce(job: dict, packed: dict, missing: list):
+    if not missing:
+        status = "done"
+    elif job["attempts"] >= (job.get("max_attempts") or EXPLAIN_MAX_ATTEMPTS):
+        status = "failed"
+    else:
+        status = "retrying"
+    await _publish(job["_id"], status, {kind: bool(packed.get(kind)) for kind in EXPLANATION_KINDS})
+
+
+async def call_explanation_microservice(image_bytes: bytes) -> dict:
+    results = {}
+
+    async def call_one(label: str):
+        try:
+            data = await explain_services[label].post_file(image_bytes)
+            results[label] = data.get(f"{label}_base64")
+        except Exception as e:
+            print(f"[ERROR] {label.upper()} microservice: {e}")
+
+    async def local_occlusion():
+        from app.ml_model import explain_occlusion_bytes
+        try:
+            results["occlusion"] = await run_in_explain_thread(explain_occlusion_bytes, image_bytes)
+        except Exception as e:
+            print(f"[ERROR] Local occlusion explainer failed: {e}")
+
+    async def local_shap():
+        from app.ml_model import explain_shap_async
+        try:
+            results["shap"] = await explain_shap_async(image_bytes)
+        except Exception as e:
+            print(f"[ERROR] Local SHAP explainer failed: {e}")
+
+    await asyncio.gather(
+        local_shap() if SHAP_BACKEND == "local" else call_one("shap"),
+        local_occlusion() if OCCLUSION_BACKEND == "local" else call_one("occlusion")
+    )
+    return results
+
+
+async def explain_scan(job: dict):
+    """Job handler: compute (or reuse) both explanations and store them on the scan."""
+    scan_id = ObjectId(job["_id"])
+    cache_key = job["payload"].get("cache_key")
+
+    # only the explanation kinds still missing are computed on a retry
+    doc = await scans_collection.find_one(
+        {"_id": scan_id}, {"image_file_id": 1, "image_data": 1, "explanations": 1}
+    )
+    if doc is None:
+        # scan deleted in the meantime; still end any open event stream
+        await _publish(job["_id"], "failed", {kind: False for kind in EXPLANATION_KINDS})
+        return
+    existing = doc.get("explanations") or {}
+
+    # 1. Reuse explanations for identical uploads, otherwise call the microservices
+    cached = await prediction_cache.get(cache_key) if cache_key else None
+    if cached and cached.get("shap") and cached.get("occlusion"):
+        # older cache entries hold base64 strings; pack_explanations converts those too
+        packed = await run_in_thread(pack_explanations, cached)
+    else:
+        image_bytes = await load_scan_image(doc)
+        if not image_bytes:
+            # nothing to explain; retrying won't bring the image back
+            await _publish(job["_id"], "failed", {kind: has_explanation(existing, kind) for kind in EXPLANATION_KINDS})
+            return
+        result = await call_explanation_microservice(image_bytes)
+        # 2. Decode + recompress once, off the event loop
+        packed = await run_in_thread(pack_explanations, result)
+        for kind in EXPLANATION_KINDS:
+            packed[kind] = packed[kind] or existing.get(kind)
+        if cache_key and packed["shap"] and packed["occlusion"]:
+            await prediction_cache.update(cache_key, **packed)
+
+    # 3. Store whatever is available; missing kinds make the job retry with backoff
+    update = explanation_update(packed)
+    if update["$set"]:
+        await scans_collection.update_one({"_id": scan_id}, update)
+    missing = [kind for kind in EXPLANATION_KINDS if not packed.get(kind)]
+    await _announce(job, packed, missing)
+    if missing:
+        raise ExplanationIncomplete(f"no {', '.join(missing)} explanation")
+
+
+def _make_store():
+    if EXPLAIN_QUEUE_BACKEND == "memory":
+        return MemoryJobStore()
+    return MongoJobStore(db["explanation_jobs"])
+
+
+explain_queue = JobWorker(
+    _make_store(),
+    explain_scan,
+    concurrency=EXPLAIN_WORKER_CONCURRENCY,
+    poll_interval_s=EXPLAIN_POLL_INTERVAL_S,
+    lease_s=EXPLAIN_JOB_LEASE_S,
+    max_attempts=EXPLAIN_MAX_ATTEMPTS,
+    backoff_base_s=EXPLAIN_BACKOFF_BASE_S,
+    backoff_max_s=EXPLAIN_BACKOFF_MAX_S,
+)
+
+
+async def enqueue_explanation(scan_id: str, cache_key: str | None = None) -> bool:
+    """Queue explanations for a scan; a no-op while a job for it is already queued or running."""
+    return await explain_queue.enqueue(scan_id, {"cache_key": cache_key})
+
+
+async def explanation_status(scan_id: str) -> dict | None:
+    job = await explain_queue.store.get(scan_id)
+    if job is None:
+        return None
+    return {
+        "scan_id": scan_id,
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "max_attempts": job.get("max_attempts"),
+        "last_error": job.get("last_error"),
+        "next_attempt_at": job["run_at"] if job["status"] == "queued" else None,
+        "updated_at": job.get("updated_at"),
+    }
+
+
+def _check_event_backend():
+    # explanation events only cross process boundaries with PUBSUB_BACKEND=mongo
+    if PUBSUB_BACKEND != "memory":
+        return
+    if EXPLAIN_WORKER_MODE == "external" or int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        print("[WARN] PUBSUB_BACKEND=memory does not deliver explanation events across processes, but "
+              "explanation workers are external or the API runs several workers. /events streams only notice "
+              "results when they re-check every SSE_HEARTBEAT_S; set PUBSUB_BACKEND=mongo.")
+
+
+async def start_explain_workers(run_workers: bool = EXPLAIN_WORKER_MODE == "inline", listen_events: bool = True):
+    _check_event_backend()
+    await explain_queue.store.ensure_indexes()
+    await events.start(listen=listen_events)
+    if run_workers:
+        explain_queue.start()
+
+
+async def _run_standalone():
+    # a standalone worker only publishes events; the API processes deliver them
+    await start_explain_workers(run_workers=True, listen_events=False)
+    print(f"[INFO] Explanation worker {explain_queue.worker_id} running "
+          f"({EXPLAIN_WORKER_CONCURRENCY} concurrent jobs)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await explain_queue.stop()
+        await explain_http.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_run_standalone())
+    except KeyboardInterrupt:
+        pass
@@ -1,8 +1,15 @@
 # app/main.py
+from .utils.startup import startup  # first import: starts the startup clock
+
+import asyncio
+import os
 from fastapi import FastAPI
-from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware
 
+# FAST_START: bind the port immediately and load/warm the model in the background;
+# /api/ready answers 503 until inference is warm.
+FAST_START = os.getenv("FAST_START", "false").lower() in ("1", "true", "yes")
+
 app = FastAPI()
 
 # Configure CORS as before…
@@ -12,29 +19,80 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-# placeholder for model & explainer
+def _load_and_warm_model():
+    import numpy as np
+    from .ml_model import (
+        registry, predict_batch, start_process_pool, active_model_version, INFERENCE_BACKEND, INFERENCE_WORKERS,
+        INPUT_SHAPE,
+    )
+
+    try:
+        if INFERENCE_WORKERS <= 0:
+            # with worker processes only the workers load the model
+            with startup.phase("model_load"):
+                registry.get()
+        with startup.phase("process_pool"):
+            start_process_pool()
+        with startup.phase("warmup"):
+            # builds (or loads the cached) TFLite flatbuffer too when that backend is selected
+            predict_batch(np.zeros((1, *INPUT_SHAPE), dtype=np.float32))
+    except Exception as e:
+        startup.mark_failed(e)
+        raise
+    app.state.model_registry = registry
+    print(f"[INFO] Model {active_model_version()} ready ({INFERENCE_BACKEND} backend)")
+    startup.mark_ready()
+
+# load the shared model once; routes fetch it from the registry
 @app.on_event("startup")
-def setup_model():
-    import tensorflow as tf
-    from tensorflow.keras.models import load_model
+async def setup_model():
+    if FAST_START:
+        loop = asyncio.get_running_loop()
+        app.state.model_warmup = loop.run_in_executor(None, _load_and_warm_model)
+    else:
+        _load_and_warm_model()
 
-    # Resolve the path to the model folder next to main.py
-    BASE_DIR  = Path(__file__).resolve().parent
-    MODEL_DIR = BASE_DIR.parent / "app" / "model"
-    MODEL_PATH = MODEL_DIR / "best_model.keras"
+@app.on_event("startup")
+async def setup_indexes():
+    from .database import ensure_indexes
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def setup_prediction_cache():
+    from .utils.prediction_cache import prediction_cache
+    await prediction_cache.ensure_indexes()
 
-    if not MODEL_PATH.is_file():
-        raise RuntimeError(f"Model not found at {MODEL_PATH!r}")
+@app.on_event("startup")
+async def setup_explain_workers():
+    # EXPLAIN_WORKER_MODE=external leaves the jobs to `python -m app.explain_jobs` processes
+    from .explain_jobs import start_explain_workers
+    await start_explain_workers()
 
-    app.state.model = load_model(str(MODEL_PATH), compile=False)
-    print(f"[INFO] Model loaded at startup from {MODEL_PATH}")
+@app.on_event("shutdown")
+async def stop_inference_batcher():
+    from . import ml_model
+    from .ml_model import batcher, stop_process_pool
+    from .explain_jobs import explain_queue, explain_http
+    from .utils.pubsub import events
+    from .reports import shutdown_report_pool
+    await explain_queue.stop()
+    await explain_http.close()
+    await events.stop()
+    shutdown_report_pool()
+    await batcher.stop()
+    if ml_model.shap_service is not None:
+        await ml_model.shap_service.batcher.stop()
+    stop_process_pool()
 
 # include your routers
-from .routes import health, users, admin, scan, google_auth
+with startup.phase("import_routers"):
+    from .routes import health, users, admin, scan, google_auth
 app.include_router(health.router, prefix="/api", tags=["Health"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 app.include_router(scan.router, prefix="/scan", tags=["Scan"])
 app.include_router(google_auth.router)
+startup.mark("import_app")
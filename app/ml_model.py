@@ -2,15 +2,38 @@ from PIL import Image as PILImage
 PILImage._showxv = lambda *args, **kwargs: None  # disables internal GUI calls
 PILImage.show = lambda *args, **kwargs: None
 
+import io
+import os
 from pathlib import Path
 import numpy as np
 from PIL import Image, UnidentifiedImageError
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-import shap
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from dotenv import load_dotenv
+
+# TensorFlow, shap and the TFLite backend are imported lazily (model registry,
+# explainers) so importing this module stays cheap and the API binds quickly.
+
+from app.model_registry import ModelRegistry
+from app.utils.inference_batcher import InferenceBatcher
+from app.utils.prediction_cache import content_key
+from app.utils.thread_executor import run_in_thread
+
+load_dotenv()
+
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras").lower()   # "keras" or "tflite"
+TFLITE_QUANTIZATION = os.getenv("TFLITE_QUANTIZATION", "none").lower()  # "none", "float16", "int8"
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))  # 0 = run the model in the API process
+INFERENCE_MAX_IMAGE_BYTES = int(os.getenv("INFERENCE_MAX_IMAGE_BYTES", str(16 * 1024 * 1024)))  # per-worker upload buffer
+TTA_MODE = os.getenv("TTA_MODE", "off").lower()  # "off", "auto" (low-confidence scans only) or "always"
+TTA_CONFIDENCE_THRESHOLD = float(os.getenv("TTA_CONFIDENCE_THRESHOLD", "0.6"))
+TTA_CROP_SIZE = int(os.getenv("TTA_CROP_SIZE", "56"))
+# uploads are decoded once at (at least) this size; the model input and the thumbnails both come from it
+UPLOAD_DECODE_SIZE = int(os.getenv("UPLOAD_DECODE_SIZE", "384"))
+# batch sizes the compiled predict path is warmed (and, under XLA, padded) to
+INFERENCE_WARMUP_BATCH_SIZES = sorted({
+    int(n) for n in os.getenv("INFERENCE_WARMUP_BATCH_SIZES", f"1,4,{INFERENCE_MAX_BATCH_SIZE}").split(",") if n.strip()
+})
 
 
 # --- Label Mapping ---
@@ -21,15 +44,20 @@ label_mapping = {
 reverse_label_mapping = {v: k for k, v in label_mapping.items()}
 class_names = [label_mapping[i] for i in sorted(label_mapping.keys())]
 
-# --- Load Keras Model Once ---
+# --- Shared Model Registry (each version loaded once) ---
 ROUTES_DIR = Path(__file__).resolve().parent
-MODEL_PATH = ROUTES_DIR / "model" / "best_model.keras"
+MODEL_DIR = ROUTES_DIR / "model"
+MODEL_PATH = Path(os.getenv("MODEL_PATH", MODEL_DIR / "best_model.keras"))
+INPUT_SHAPE = (64, 64, 3)
+
+
+def _warmup(m):
+    # trace the compiled predict path for the batch sizes we serve before the model receives traffic
+    from app.tf_runtime import warm_compiled
+    warm_compiled(m, INPUT_SHAPE, INFERENCE_WARMUP_BATCH_SIZES)
 
-if not MODEL_PATH.is_file():
-    raise FileNotFoundError(f"Model not found at {MODEL_PATH!r}")
 
-model = load_model(str(MODEL_PATH), compile=False)
-print(f"[INFO] Loaded model from {MODEL_PATH}")
+registry = ModelRegistry(MODEL_PATH, warmup=_warmup)
 
 # --- Fast Preprocessing ---
 def preprocess_image(image_path, target_size=(64, 64)):
@@ -44,18 +72,314 @@ def preprocess_image(image_path, target_size=(64, 64)):
         print(f"[ERROR] Preprocessing failed: {e}")
     return None
 
+
+def decode_upload(image_bytes: bytes) -> Image.Image:
+    """
+    The one decode of an uploaded image; the model input and the thumbnails
+    are both derived from it. JPEGs are decoded straight at a reduced DCT
+    scale (1/2 .. 1/8) via draft mode, never below UPLOAD_DECODE_SIZE, so a
+    12 MP photo is never fully materialized at full resolution.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.format == "JPEG":
+        img.draft("RGB", (UPLOAD_DECODE_SIZE, UPLOAD_DECODE_SIZE))
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
+def tensor_from_image(img: Image.Image, target_size=(64, 64)) -> np.ndarray:
+    # box-reduce before the final resize; float32 conversion is the only copy, [np.newaxis] is a view
+    return np.asarray(img.resize(target_size, reducing_gap=2.0), dtype=np.float32)[np.newaxis]  # (1, 64, 64, 3)
+
+
+def preprocess_image_bytes(image_bytes: bytes, target_size=(64, 64)):
+    """In-memory variant of preprocess_image for uploaded bytes; every model path goes through it."""
+    try:
+        return tensor_from_image(decode_upload(image_bytes), target_size)
+    except UnidentifiedImageError:
+        print("[ERROR] Invalid image: uploaded bytes are not a readable image")
+    except Exception as e:
+        print(f"[ERROR] Preprocessing failed: {e}")
+    return None
+
+def preprocess_with_thumbnails(image_bytes: bytes, target_size=(64, 64)):
+    """
+    preprocess_image_bytes plus the WebP thumbnails, both from the same single
+    decode. Returns (tensor, thumbnails); tensor is None for unreadable images.
+    """
+    from app.utils.thumbnails import make_thumbnails
+
+    try:
+        img = decode_upload(image_bytes)
+        return tensor_from_image(img, target_size), make_thumbnails(img)
+    except UnidentifiedImageError:
+        print("[ERROR] Invalid image: uploaded bytes are not a readable image")
+    except Exception as e:
+        print(f"[ERROR] Preprocessing failed: {e}")
+    return None, {}
+
 # --- Core Fast Prediction ---
+def predict_local(img_tensor: np.ndarray) -> np.ndarray:
+    version, keras_model = registry.get_active()
+    if INFERENCE_BACKEND == "tflite":
+        from app.tflite_backend import get_backend
+        return get_backend(keras_model, version, TFLITE_QUANTIZATION).predict(img_tensor)
+    return _predict_compiled(keras_model, img_tensor)
+
+
+def _predict_compiled(keras_model, img_tensor: np.ndarray) -> np.ndarray:
+    from app.tf_runtime import compiled_predict, TF_JIT_COMPILE
+
+    n = len(img_tensor)
+    if TF_JIT_COMPILE and INFERENCE_WARMUP_BATCH_SIZES:
+        # XLA compiles per shape: larger batches (e.g. TTA variants) run in slices of the
+        # largest warmed size, smaller ones are padded up to the nearest warmed size
+        largest = INFERENCE_WARMUP_BATCH_SIZES[-1]
+        if n > largest:
+            return np.concatenate([
+                _predict_compiled(keras_model, img_tensor[start:start + largest]) for start in range(0, n, largest)
+            ], axis=0)
+        bucket = next(b for b in INFERENCE_WARMUP_BATCH_SIZES if b >= n)
+        if bucket != n:
+            pad = np.zeros((bucket - n, *img_tensor.shape[1:]), dtype=np.float32)
+            img_tensor = np.concatenate([img_tensor, pad], axis=0)
+
+    preds = compiled_predict(keras_model, INPUT_SHAPE)(np.asarray(img_tensor, dtype=np.float32))
+    return preds.numpy()[:n]
+
+
+def predict_batch(img_tensor: np.ndarray) -> np.ndarray:
+    if process_pool is not None:
+        return process_pool.predict(img_tensor)
+    return predict_local(img_tensor)
+
+
+async def predict_batch_async(img_tensor: np.ndarray) -> np.ndarray:
+    if process_pool is not None:
+        return await process_pool.predict_async(img_tensor)
+    return await run_in_thread(predict_local, img_tensor)
+
+
+def _fits_process_pool(image_bytes: bytes) -> bool:
+    # uploads larger than a worker's shared-memory buffer are decoded here instead
+    return process_pool is not None and len(image_bytes) <= process_pool.max_image_bytes
+
+
+def preprocess_upload(image_bytes: bytes):
+    if _fits_process_pool(image_bytes):
+        return process_pool.preprocess(image_bytes)
+    return preprocess_image_bytes(image_bytes)
+
+
+def preprocess_upload_with_thumbnails(image_bytes: bytes):
+    if _fits_process_pool(image_bytes):
+        return process_pool.preprocess_with_thumbnails(image_bytes)
+    return preprocess_with_thumbnails(image_bytes)
+
+
+def decode_prediction(probs: np.ndarray):
+    pred_idx = int(np.argmax(probs))
+    confidence = round(float(np.max(probs)), 4)
+    label = label_mapping.get(pred_idx, 'Unknown')
+    return label, confidence
+
+
 def predict_scan(image_path: str):
     img_tensor = preprocess_image(image_path)
     if img_tensor is None:
         return "Unknown", 0.0
 
     try:
-        preds = model.predict(img_tensor, verbose=0)
-        pred_idx = int(np.argmax(preds[0]))
-        confidence = round(float(np.max(preds[0])), 4)
-        label = label_mapping.get(pred_idx, 'Unknown')
-        return label, confidence
+        preds = predict_batch(img_tensor)
+        return decode_prediction(preds[0])
     except Exception as e:
         print(f"[ERROR] Prediction failed: {e}")
         return "Error", 0.0
+
+
+# everything besides the model version that changes what a prediction returns
+INFERENCE_VARIANT = "|".join([
+    INFERENCE_BACKEND,
+    TFLITE_QUANTIZATION if INFERENCE_BACKEND == "tflite" else "",
+    f"tta={TTA_MODE}",
+    f"{TTA_CONFIDENCE_THRESHOLD}:{TTA_CROP_SIZE}" if TTA_MODE != "off" else "",
+])
+
+
+def prediction_cache_key(digest: str) -> str | None:
+    """prediction_cache key of an upload's image_digest() for the active model and inference settings; None until a model is active."""
+    return content_key(digest, active_model_version(), INFERENCE_VARIANT)
+
+
+# --- Inference Worker Processes (optional) ---
+process_pool = None
+
+
+def start_process_pool():
+    """Start INFERENCE_WORKERS model processes; called once from the API startup hook."""
+    global process_pool
+    if INFERENCE_WORKERS <= 0 or process_pool is not None:
+        return None
+
+    from app.utils.process_pool import InferencePool
+
+    pool = InferencePool(
+        INFERENCE_WORKERS,
+        model_path=registry.info()["active_path"] or MODEL_PATH,
+        input_shape=INPUT_SHAPE,
+        num_classes=len(label_mapping),
+        max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+        max_image_bytes=INFERENCE_MAX_IMAGE_BYTES,
+    )
+    pool.start()
+    process_pool = pool
+    return pool
+
+
+def stop_process_pool():
+    global process_pool
+    if process_pool is not None:
+        process_pool.shutdown()
+        process_pool = None
+
+
+# with worker processes the API process never loads the model for inference;
+# the pool is the source of truth for which version serves predictions
+def active_model_version() -> str | None:
+    if process_pool is not None:
+        return process_pool.version
+    return registry.version
+
+
+def model_info() -> dict:
+    info = registry.info()
+    if process_pool is not None:
+        info.update(active_version=process_pool.version, active_path=str(process_pool.model_path),
+                    inference_workers=process_pool.num_workers)
+    return info
+
+
+def reload_model(model_path: Path) -> str:
+    """Activate `model_path` wherever inference runs; blocking, call through run_in_thread."""
+    if process_pool is None:
+        return registry.swap(model_path)
+    version = process_pool.reload(model_path)
+    if registry.version is not None:
+        registry.swap(model_path)  # loaded in this process for the local SHAP explainer
+    else:
+        registry.default_path = Path(model_path)  # picked up if it is ever loaded here
+    return version
+
+
+# --- Micro-batched Prediction ---
+batcher = InferenceBatcher(
+    predict_batch_async,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=INFERENCE_MAX_WAIT_MS,
+    max_in_flight=max(1, INFERENCE_WORKERS),  # keep every worker process busy
+)
+
+
+# --- Test-time Augmentation ---
+def tta_variants(img_tensor: np.ndarray, crop: int = TTA_CROP_SIZE) -> np.ndarray:
+    """
+    (n, H, W, C) -> (n * V, H, W, C): identity, flips, rotations and four corner
+    crops (resized back to H x W), grouped per image so one forward pass scores all.
+    """
+    n, height, width = img_tensor.shape[:3]
+    variants = [
+        img_tensor,
+        img_tensor[:, :, ::-1],
+        img_tensor[:, ::-1, :],
+        np.rot90(img_tensor, 1, axes=(1, 2)),
+        np.rot90(img_tensor, 2, axes=(1, 2)),
+        np.rot90(img_tensor, 3, axes=(1, 2)),
+    ]
+    if crop < min(height, width):
+        rows = np.linspace(0, crop - 1, height).round().astype(np.intp)
+        cols = np.linspace(0, crop - 1, width).round().astype(np.intp)
+        for y, x in ((0, 0), (0, width - crop), (height - crop, 0), (height - crop, width - crop)):
+            patch = img_tensor[:, y:y + crop, x:x + crop]
+            variants.append(patch[:, rows][:, :, cols])
+
+    stacked = np.stack(variants, axis=1)  # (n, V, H, W, C)
+    return np.ascontiguousarray(stacked.reshape(-1, *img_tensor.shape[1:]), dtype=np.float32)
+
+
+def tta_aggregate(preds: np.ndarray, n: int) -> np.ndarray:
+    return preds.reshape(n, -1, preds.shape[-1]).mean(axis=1)
+
+
+async def predict_probs_async(img_tensor: np.ndarray) -> np.ndarray:
+    """
+    Class probabilities for an (n, H, W, C) batch through the shared batcher.
+    With TTA_MODE=always every image is scored on its augmentations; with
+    TTA_MODE=auto only images whose top-1 confidence is below the threshold
+    get a second, single batched pass over all of their augmentations.
+    """
+    n = len(img_tensor)
+    if TTA_MODE == "always":
+        return tta_aggregate(await batcher.submit(tta_variants(img_tensor)), n)
+
+    preds = np.array(await batcher.submit(img_tensor))
+    if TTA_MODE == "auto":
+        low = preds.max(axis=1) < TTA_CONFIDENCE_THRESHOLD
+        if low.any():
+            tta_preds = await batcher.submit(tta_variants(img_tensor[low]))
+            preds[low] = tta_aggregate(tta_preds, int(low.sum()))
+    return preds
+
+
+async def predict_scan_async(image_bytes: bytes):
+    """Same contract as predict_scan, but for uploaded bytes and sharing forward passes with concurrent requests."""
+    img_tensor = await run_in_thread(preprocess_upload, image_bytes)
+    return await predict_tensor_async(img_tensor)
+
+
+async def predict_tensor_async(img_tensor):
+    if img_tensor is None:
+        return "Unknown", 0.0
+
+    try:
+        preds = await predict_probs_async(img_tensor)
+        return decode_prediction(preds[0])
+    except Exception as e:
+        print(f"[ERROR] Prediction failed: {e}")
+        return "Error", 0.0
+
+
+async def predict_many_async(tensors: list) -> list:
+    """Predict a list of (1, 64, 64, 3) tensors with a single batched forward pass."""
+    try:
+        preds = await predict_probs_async(np.concatenate(tensors, axis=0))
+        return [decode_prediction(p) for p in preds]
+    except Exception as e:
+        print(f"[ERROR] Batch prediction failed: {e}")
+        return [("Error", 0.0)] * len(tensors)
+
+
+# --- In-process Explanations ---
+def explain_occlusion_bytes(image_bytes: bytes):
+    from app.occlusion import explain_occlusion
+
+    img_tensor = preprocess_upload(image_bytes)
+    if img_tensor is None:
+        return None
+    return explain_occlusion(img_tensor, predict_batch)
+
+
+shap_service = None
+
+
+def get_shap_service():
+    global shap_service
+    if shap_service is None:
+        from app.shap_explainer import ShapService
+        shap_service = ShapService(registry.get_active, INPUT_SHAPE, preprocess_image_bytes)
+    return shap_service
+
+
+async def explain_shap_async(image_bytes: bytes):
+    img_tensor = await run_in_thread(preprocess_upload, image_bytes)
+    if img_tensor is None:
+        return None
+    return await get_shap_service().explain(img_tensor)
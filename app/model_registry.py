@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from pathlib import Path
+
+
+def _load_keras_model(path: Path):
+    from app.tf_runtime import configure_threads
+    configure_threads()
+    from tensorflow.keras.models import load_model
+    return load_model(str(path), compile=False)
+
+
+def file_version(path: Path) -> str:
+    """Content hash of a model file, so the same weights always map to the same version."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+class ModelRegistry:
+    """
+    Process-wide owner of the loaded model(s). Each model version is
+    deserialized once; callers fetch the active instance with `get()` on every
+    request so a `swap()` takes effect atomically for the next prediction.
+    """
+
+    def __init__(self, default_path: Path, loader=_load_keras_model, warmup=None):
+        self.default_path = Path(default_path)
+        self.loader = loader
+        self.warmup = warmup
+
+        self._lock = threading.Lock()        # guards the maps below; held only briefly
+        self._load_lock = threading.Lock()   # serializes deserialization
+        self._models: dict[str, object] = {}
+        self._paths: dict[str, Path] = {}
+        self._active: str | None = None
+
+    def load(self, path: Path | None = None) -> str:
+        """Load a model file (no-op if that version is already loaded) and return its version."""
+        path = Path(path or self.default_path)
+        if not path.is_file():
+            raise FileNotFoundError(f"Model not found at {path!r}")
+
+        version = file_version(path)
+        with self._load_lock:
+            with self._lock:
+                if version in self._models:
+                    return version
+
+            # deserialize and warm without holding _lock so predictions keep flowing
+            model = self.loader(path)
+            if self.warmup is not None:
+                self.warmup(model)
+
+            with self._lock:
+                self._models[version] = model
+                self._paths[version] = path
+        print(f"[INFO] Loaded model {version} from {path}")
+        return version
+
+    def swap(self, path: Path, keep_previous: bool = False) -> str:
+        """Load `path` and make it the active model in one step."""
+        version = self.load(path)
+        with self._lock:
+            previous, self._active = self._active, version
+            if previous and previous != version and not keep_previous:
+                self._models.pop(previous, None)
+                self._paths.pop(previous, None)
+        print(f"[INFO] Active model switched {previous} -> {version}")
+        return version
+
+    def get(self):
+        return self.get_active()[1]
+
+    def get_active(self) -> tuple[str, object]:
+        """(version, model) of the active model, read together so a concurrent swap can't mix them."""
+        if self._active is None:
+            with self._lock:
+                needs_load = self._active is None
+            if needs_load:
+                version = self.load(self.default_path)
+                with self._lock:
+                    if self._active is None:
+                        self._active = version
+        with self._lock:
+            return self._active, self._models[self._active]
+
+    @property
+    def version(self) -> str | None:
+        return self._active
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "active_version": self._active,
+                "active_path": str(self._paths.get(self._active)) if self._active else None,
+                "loaded_versions": list(self._models.keys()),
+            }
@@ -0,0 +1,95 @@
+"""
+In-process occlusion explainer.
+
+All occluded variants of the 64x64 input are built as one NumPy batch and
+scored through the already-loaded model in a few large calls. The heatmap is
+colorized and blended with plain NumPy and encoded by PIL, no matplotlib.
+"""
+import base64
+import io
+import os
+
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OCCLUSION_WINDOW = int(os.getenv("OCCLUSION_WINDOW", "8"))
+OCCLUSION_STRIDE = int(os.getenv("OCCLUSION_STRIDE", "4"))
+OCCLUSION_BATCH_SIZE = int(os.getenv("OCCLUSION_BATCH_SIZE", "256"))
+OCCLUSION_RENDER_SIZE = int(os.getenv("OCCLUSION_RENDER_SIZE", "256"))
+
+
+def window_masks(height: int, width: int, window: int, stride: int) -> np.ndarray:
+    """Boolean (N, H, W) masks, one per occlusion window position."""
+    ys = np.arange(0, max(height - window, 0) + 1, stride)
+    xs = np.arange(0, max(width - window, 0) + 1, stride)
+    rows = np.arange(height)
+    cols = np.arange(width)
+
+    row_mask = (rows[None, :] >= ys[:, None]) & (rows[None, :] < ys[:, None] + window)  # (ny, H)
+    col_mask = (cols[None, :] >= xs[:, None]) & (cols[None, :] < xs[:, None] + window)  # (nx, W)
+    masks = row_mask[:, None, :, None] & col_mask[None, :, None, :]                     # (ny, nx, H, W)
+    return masks.reshape(-1, height, width)
+
+
+def occluded_batch(img: np.ndarray, masks: np.ndarray, fill: float | None = None) -> np.ndarray:
+    """(N, H, W, C) copies of `img` with each mask's window replaced by `fill` (default: image mean)."""
+    fill_value = np.float32(img.mean() if fill is None else fill)
+    return np.where(masks[..., None], fill_value, img[None]).astype(np.float32, copy=False)
+
+
+def occlusion_map(img: np.ndarray, predict_fn, target_idx: int | None = None,
+                  window: int = OCCLUSION_WINDOW, stride: int = OCCLUSION_STRIDE,
+                  batch_size: int = OCCLUSION_BATCH_SIZE):
+    """
+    Per-pixel drop in target-class probability when that pixel is occluded,
+    averaged over every window that covers it. `img` is (H, W, C) float32.
+    """
+    height, width = img.shape[:2]
+    base_probs = predict_fn(img[None])[0]
+    if target_idx is None:
+        target_idx = int(np.argmax(base_probs))
+
+    masks = window_masks(height, width, window, stride)
+    variants = occluded_batch(img, masks)
+
+    scores = np.empty(len(variants), dtype=np.float32)
+    for start in range(0, len(variants), batch_size):
+        scores[start:start + batch_size] = predict_fn(variants[start:start + batch_size])[:, target_idx]
+
+    drops = base_probs[target_idx] - scores
+    masks_f = masks.astype(np.float32)
+    coverage = masks_f.sum(axis=0)
+    heat = np.tensordot(drops, masks_f, axes=1) / np.maximum(coverage, 1.0)
+    return heat, target_idx
+
+
+def _colorize(heat: np.ndarray) -> np.ndarray:
+    """Jet-style RGB colormap for values in [0, 1]."""
+    r = np.clip(1.5 - np.abs(4 * heat - 3), 0, 1)
+    g = np.clip(1.5 - np.abs(4 * heat - 2), 0, 1)
+    b = np.clip(1.5 - np.abs(4 * heat - 1), 0, 1)
+    return (np.stack([r, g, b], axis=-1) * 255).astype(np.uint8)
+
+
+def render_heatmap(img: np.ndarray, heat: np.ndarray, size: int = OCCLUSION_RENDER_SIZE, alpha: float = 0.45) -> bytes:
+    positive = np.clip(heat, 0, None)
+    peak = positive.max()
+    norm = positive / peak if peak > 0 else positive
+
+    overlay = Image.fromarray(_colorize(norm)).resize((size, size), Image.BILINEAR)
+    base = Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).resize((size, size), Image.BILINEAR)
+    blended = Image.blend(base, overlay, alpha)
+
+    buf = io.BytesIO()
+    blended.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def explain_occlusion(img_tensor: np.ndarray, predict_fn, **kwargs) -> str:
+    """(1, H, W, C) tensor -> base64 PNG, the same payload the occlusion microservice returned."""
+    img = img_tensor[0]
+    heat, _ = occlusion_map(img, predict_fn, **kwargs)
+    return base64.b64encode(render_heatmap(img, heat)).decode()
@@ -0,0 +1,276 @@
+"""
+PDF scan reports. Inputs are gathered on the event loop (Mongo / GridFS),
+rendering happens in memory on a dedicated bounded pool so report bursts
+neither block the loop nor starve inference of the shared thread pool.
+
+    REPORT_WORKERS=2           # reports rendered at once
+    REPORT_EXECUTOR=thread     # "process" renders in spawned processes (no GIL contention)
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from app.database import scans_collection, users_collection
+from app.utils.explanation_store import EXPLANATION_KINDS, explanation_image
+from app.utils.image_store import load_scan_image
+from app.utils.report_cache import report_cache
+
+load_dotenv()
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_EXECUTOR = os.getenv("REPORT_EXECUTOR", "thread").lower()  # "thread" or "process"
+REPORT_STREAM_CHUNK = 64 * 1024
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", str(REPORT_WORKERS)))
+# image settings reports are rendered with: parsed only here, passed to pdf_generator and part of report_version.
+# Embedded images are resampled to REPORT_IMAGE_DPI for their box on the page (0 = embed originals)
+REPORT_IMAGE_DPI = int(os.getenv("REPORT_IMAGE_DPI", "150"))
+REPORT_IMAGE_QUALITY = int(os.getenv("REPORT_IMAGE_QUALITY", "80"))
+EXPORT_MAX_SCANS = int(os.getenv("EXPORT_MAX_SCANS", "0"))  # 0 = every matching scan
+
+readable_class_mapping = {
+    "nv": "Melanocytic Nevi",
+    "mel": "Melanoma",
+    "bkl": "Benign Keratosis-like Lesions",
+    "bcc": "Basal Cell Carcinoma",
+    "akiec": "Actinic Keratoses",
+    "vasc": "Vascular Lesions",
+    "df": "Dermatofibroma"
+}
+
+# bump when the report layout changes so cached reports are not served any more
+REPORT_TEMPLATE_VERSION = "3"  # 2: images resampled to REPORT_IMAGE_DPI, 3: scan date instead of render date
+
+# text fields printed on the report
+REPORT_FIELDS = ("patient_name", "patient_age", "gender", "scan_area", "additional_info", "prediction", "uploaded_at")
+# enough to decide whether a cached report is still current, without any image bytes
+REPORT_META_PROJECTION = {**{f: 1 for f in REPORT_FIELDS}, "content_version": 1, "image_file_id": 1}
+# everything the report needs; the image and explanation bytes are added by report_inputs()
+REPORT_PROJECTION = {**REPORT_META_PROJECTION, "explanations": 1, "image_data": 1}
+# bulk export: report metadata plus what the archive entry names and the owner lookup need
+EXPORT_PROJECTION = {**REPORT_META_PROJECTION, "user_email": 1}
+
+_executor: Executor | None = None
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if REPORT_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(REPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            _executor = ThreadPoolExecutor(REPORT_WORKERS, thread_name_prefix="report")
+    return _executor
+
+
+def shutdown_report_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def report_filename(scan_id) -> str:
+    return f"DermaXplain_Report_{scan_id}.pdf"
+
+
+async def report_inputs(user: dict, doc: dict) -> tuple[dict, dict]:
+    """(user, scan) as the PDF generator expects them, with images as raw bytes (all picklable)."""
+    prediction = dict(doc.get("prediction") or {})
+    prediction["readable_name"] = readable_class_mapping.get(prediction.get("class", ""), "Unknown")
+    images = {kind: explanation_image(doc.get("explanations"), kind) for kind in EXPLANATION_KINDS}
+    scan = {
+        **{k: doc.get(k) for k in ("patient_name", "patient_age", "gender", "scan_area", "additional_info", "uploaded_at")},
+        "prediction": prediction,
+        "image_bytes": await load_scan_image(doc),
+        "explanation_images": {kind: img[0] for kind, img in images.items() if img},
+    }
+    return {"name": user.get("name"), "email": user.get("email")}, scan
+
+
+def _render(user: dict, scan: dict) -> bytes:
+    from app.utils.pdf_generator import render_pdf_report  # reportlab is imported on first report
+    return render_pdf_report(user, scan, image_dpi=REPORT_IMAGE_DPI, image_quality=REPORT_IMAGE_QUALITY)
+
+
+async def render_report(user: dict, doc: dict) -> bytes:
+    report_user, scan = await report_inputs(user, doc)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _render, report_user, scan)
+
+
+def report_version(user: dict, meta: dict) -> str:
+    """
+    Changes whenever the rendered report would: scan text fields, the scan's
+    content_version (bumped on every explanation write), the image, the
+    requesting user's name/email, the report template and image settings.
+    """
+    basis = {
+        "fields": {f: meta.get(f) for f in REPORT_FIELDS},
+        "content_version": meta.get("content_version", 0),
+        "image": str(meta.get("image_file_id")),
+        "user": [user.get("name"), user.get("email")],
+        "template": REPORT_TEMPLATE_VERSION,
+        "images": [REPORT_IMAGE_DPI, REPORT_IMAGE_QUALITY],
+    }
+    return hashlib.sha256(json.dumps(basis, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+
+async def cached_report(user: dict, meta: dict, version: str | None = None, store: bool = True) -> bytes:
+    """
+    Report for the scan described by `meta` (REPORT_META_PROJECTION), from the
+    cache when current. store=False still reads the cache but does not fill it
+    (bulk exports would otherwise push out the reports people actually revisit).
+    """
+    version = version or report_version(user, meta)
+    key = f"{meta['_id']}-{version}"
+
+    async def render():
+        doc = await scans_collection.find_one({"_id": meta["_id"]}, REPORT_PROJECTION)
+        if doc is None:
+            raise LookupError(f"scan {meta['_id']} no longer exists")
+        return await render_report(user, doc)
+
+    if store:
+        return await report_cache.get_or_render(key, render)
+    return await report_cache.get(key) or await render()
+
+
+async def iter_bytes(data: bytes, chunk_size: int = REPORT_STREAM_CHUNK):
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def export_query(patient_name: str | None = None, date_from=None, date_to=None,
+                 prediction: str | None = None, scan_area: str | None = None) -> dict:
+    """Mongo filter for a bulk export; the caller adds the owner restriction."""
+    query = {}
+    if patient_name:
+        query["patient_name"] = {"$regex": f"^{re.escape(patient_name)}$", "$options": "i"}
+    if date_from or date_to:
+        query["uploaded_at"] = {
+            **({"$gte": date_from} if date_from else {}),
+            **({"$lt": date_to} if date_to else {}),
+        }
+    if prediction:
+        query["prediction.class"] = prediction
+    if scan_area:
+        query["scan_area"] = scan_area
+    return query
+
+
+class _ZipSink:
+    """Write-only, unseekable file object: zipfile then streams entries with data descriptors."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _entry_name(meta: dict) -> str:
+    patient = re.sub(r"[^A-Za-z0-9_-]+", "_", meta.get("patient_name") or "patient").strip("_") or "patient"
+    uploaded = meta.get("uploaded_at")
+    stamp = uploaded.strftime("%Y%m%d") if uploaded else "undated"
+    return f"{patient}_{stamp}_{meta['_id']}.pdf"
+
+
+async def iter_reports_zip(query: dict, user: dict | None = None, concurrency: int = EXPORT_CONCURRENCY,
+                           max_scans: int = EXPORT_MAX_SCANS):
+    """
+    Stream a ZIP with the report of every scan matching `query`. Reports are
+    rendered `concurrency` at a time and written as they finish, so memory
+    holds at most that many PDFs regardless of how many scans match. `user`
+    is the account printed on each report; None uses each scan's owner (admin export).
+    With `max_scans` set, only the newest that many scans are exported and
+    TRUNCATED.txt in the archive says how many were left out.
+    """
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)  # PDFs are compressed already
+    owners: dict[str, dict] = {}
+    failed: list[str] = []
+    pending: set[asyncio.Task] = set()
+    exported = 0
+
+    async def owner_of(meta: dict) -> dict:
+        email = meta.get("user_email")
+        if email not in owners:
+            owners[email] = await users_collection.find_one({"email": email}, {"name": 1, "email": 1}) or {"email": email}
+        return owners[email]
+
+    async def render(meta: dict):
+        report_user = user if user is not None else await owner_of(meta)
+        return meta, await cached_report(report_user, meta, store=False)
+
+    def write_finished(done) -> bytes:
+        for task in done:
+            try:
+                meta, pdf = task.result()
+            except Exception as e:
+                failed.append(f"{getattr(task, 'scan_id', '?')}: {e}")
+                continue
+            uploaded = meta.get("uploaded_at")
+            info = zipfile.ZipInfo(_entry_name(meta), date_time=uploaded.timetuple()[:6] if uploaded else (1980, 1, 1, 0, 0, 0))
+            archive.writestr(info, pdf)
+        return sink.drain()
+
+    cursor = scans_collection.find(query, EXPORT_PROJECTION).sort("uploaded_at", -1).batch_size(100)
+    if max_scans:
+        cursor = cursor.limit(max_scans)
+    try:
+        async for meta in cursor:
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                chunk = write_finished(done)
+                if chunk:
+                    yield chunk
+            task = asyncio.create_task(render(meta))
+            task.scan_id = str(meta["_id"])
+            pending.add(task)
+            exported += 1
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            chunk = write_finished(done)
+            if chunk:
+                yield chunk
+
+        if failed:
+            archive.writestr("errors.txt", "Reports that could not be generated:\n" + "\n".join(failed) + "\n")
+        if max_scans and exported >= max_scans:
+            skipped = await scans_collection.count_documents(query) - exported
+            if skipped > 0:
+                print(f"[WARN] Report export truncated at {max_scans} scans, {skipped} left out")
+                archive.writestr(
+                    "TRUNCATED.txt",
+                    f"This export is limited to the newest {max_scans} scans (EXPORT_MAX_SCANS).\n"
+                    f"{skipped} older matching scans are not included; narrow the date range to export them.\n",
+                )
+        archive.close()
+        yield sink.drain()
+    finally:
+        # client went away mid-download: stop rendering what is left
+        for task in pending:
+            task.cancel()
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from typing import List, Optional
+from datetime import datetime
 from bson import ObjectId
 from ..database import users_collection, scans_collection
 from ..auth import get_current_user
@@ -7,7 +8,16 @@ from ..schemas import UserOut
 from .. import email
 import base64
 import os
-from fastapi import Path
+from fastapi import Path, Body, Query
+from .. import ml_model
+from ..ml_model import MODEL_DIR
+from ..utils.thread_executor import run_in_thread
+from ..utils.image_store import load_scan_image, delete_scan_images, get_thumbnail, thumbnail_size_key
+from ..utils.report_cache import report_cache
+from ..utils.thumbnails import THUMBNAIL_SIZES
+from ..utils.explanation_store import explanations_out
+from .scan import thumbnail_response, scan_image_response, scan_explanation_response, export_response
+from ..reports import export_query
 
 router = APIRouter()
 
@@ -42,8 +52,10 @@ async def delete_user(user_id: str, admin: dict = Depends(require_admin)):
     # 3) Delete user
     await users_collection.delete_one({"_id": obj_id})
 
-    # 4) Cascade delete scans
+    # 4) Cascade delete scans (and their GridFS images and cached PDF reports)
+    scan_ids = await delete_scan_images({"user_email": user["email"]})
     result = await scans_collection.delete_many({"user_email": user["email"]})
+    await report_cache.invalidate_many(scan_ids)
     # (OPTIONAL) You could log result.deleted_count here
 
     # 5) Notify the user
@@ -82,6 +94,23 @@ async def get_scan_ids_by_user_id(
     }
 
 
+@router.get("/scans/export", tags=["Admin"])
+async def export_reports_admin(
+    user_email: Optional[str] = Query(None, description="limit to one user's scans"),
+    patient_name: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    prediction: Optional[str] = Query(None),
+    scan_area: Optional[str] = Query(None),
+    admin: dict = Depends(require_admin)
+):
+    # each report shows the account that owns the scan
+    query = export_query(patient_name, date_from, date_to, prediction, scan_area)
+    if user_email:
+        query["user_email"] = user_email
+    return export_response(query, None, f"DermaXplain_Reports_all_{datetime.utcnow():%Y%m%d}.zip")
+
+
 @router.get("/scans/{scan_id}", tags=["Admin"])
 async def get_scan_by_scan_id(
     scan_id: str = Path(..., title="Scan ID"),
@@ -99,15 +128,80 @@ async def get_scan_by_scan_id(
     if "uploaded_at" in scan and hasattr(scan["uploaded_at"], "isoformat"):
         scan["uploaded_at"] = scan["uploaded_at"].isoformat()
 
-    # Handle image_data stored in DB
-    raw = scan.get("image_data")
-    if raw:
-        image_bytes = raw if isinstance(raw, (bytes, bytearray)) else raw.value
+    # Image lives in GridFS (or inline image_data for scans not yet migrated)
+    image_bytes = await load_scan_image(scan)
+    if image_bytes:
         scan["image_base64"] = base64.b64encode(image_bytes).decode("utf-8")
     else:
         scan["image_base64"] = None
 
-    # Clean binary fields
+    scan["explanations"] = explanations_out(scan.get("explanations"))
+
+    # Clean binary / reference fields
     scan.pop("image_data", None)
+    scan.pop("image_file_id", None)
+    scan.pop("thumbnails", None)
 
     return scan
+
+
+@router.get("/scans/{scan_id}/image", tags=["Admin"])
+async def get_scan_image_admin(
+    request: Request,
+    scan_id: str = Path(..., title="Scan ID"),
+    admin: dict = Depends(require_admin)
+):
+    if not ObjectId.is_valid(scan_id):
+        raise HTTPException(status_code=400, detail="Invalid scan ID")
+    return await scan_image_response(request, {"_id": ObjectId(scan_id)})
+
+
+@router.get("/scans/{scan_id}/explanations/{kind}", tags=["Admin"])
+async def get_scan_explanation_admin(
+    request: Request,
+    scan_id: str = Path(..., title="Scan ID"),
+    kind: str = Path(..., title="shap or occlusion"),
+    admin: dict = Depends(require_admin)
+):
+    if not ObjectId.is_valid(scan_id):
+        raise HTTPException(status_code=400, detail="Invalid scan ID")
+    return await scan_explanation_response(request, {"_id": ObjectId(scan_id)}, kind)
+
+
+@router.get("/scans/{scan_id}/thumbnail", tags=["Admin"])
+async def get_scan_thumbnail_admin(
+    request: Request,
+    scan_id: str = Path(..., title="Scan ID"),
+    size: int = Query(min(THUMBNAIL_SIZES)),
+    admin: dict = Depends(require_admin)
+):
+    if not ObjectId.is_valid(scan_id):
+        raise HTTPException(status_code=400, detail="Invalid scan ID")
+    size_key = thumbnail_size_key(size)
+    if size_key is None:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(THUMBNAIL_SIZES)}")
+
+    return thumbnail_response(request, await get_thumbnail({"_id": ObjectId(scan_id)}, size_key))
+
+
+@router.get("/model", tags=["Admin"])
+async def get_active_model(admin: dict = Depends(require_admin)):
+    return ml_model.model_info()
+
+
+@router.post("/model/reload", tags=["Admin"])
+async def reload_model(
+    filename: str = Body("best_model.keras", embed=True),
+    admin: dict = Depends(require_admin)
+):
+    # only files inside the model directory can be activated
+    model_path = (MODEL_DIR / filename).resolve()
+    if model_path.parent != MODEL_DIR.resolve() or not model_path.is_file():
+        raise HTTPException(status_code=404, detail="Model file not found")
+
+    try:
+        version = await run_in_thread(ml_model.reload_model, model_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model load failed: {e}")
+
+    return {**ml_model.model_info(), "active_version": version}
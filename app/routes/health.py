@@ -1,5 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
 from app.database import db
+from app.utils.startup import startup
+from app import ml_model
+from app.ml_model import batcher
+from app.utils.prediction_cache import prediction_cache
+from app.routes.scan import upload_admission
+from app.explain_jobs import explain_queue, explain_http
+from app.utils.pubsub import events
+from app.utils.report_cache import report_cache
+from app.routes.admin import require_admin
 
 router = APIRouter()
 
@@ -7,6 +17,11 @@ router = APIRouter()
 def health_check():
     return {"status": "API is healthy ✅"}
 
+@router.get("/ready")
+def readiness_check():
+    # 503 until the model is loaded and warm (see FAST_START)
+    return JSONResponse(status_code=200 if startup.ready else 503, content=startup.report())
+
 @router.get("/db")
 async def health_check():
     try:
@@ -17,4 +32,33 @@ async def health_check():
         return {
             "status": "❌ API is running but MongoDB connection failed!",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+@router.get("/inference/stats", dependencies=[Depends(require_admin)])
+def inference_stats():
+    stats = batcher.stats()
+    if ml_model.process_pool is not None:
+        stats["process_pool"] = ml_model.process_pool.stats()
+    return stats
+
+
+@router.get("/cache/stats", dependencies=[Depends(require_admin)])
+def cache_stats():
+    return prediction_cache.stats()
+
+
+@router.get("/upload/stats", dependencies=[Depends(require_admin)])
+def upload_stats():
+    return upload_admission.stats()
+
+
+@router.get("/explain/stats", dependencies=[Depends(require_admin)])
+async def explain_stats():
+    # counts cover every worker process sharing the queue; the rest is this process only.
+    # Admin-only like the other stats: it names the microservice URLs and this worker's host:pid
+    return {**await explain_queue.stats(), "services": explain_http.stats(), "events": events.stats()}
+
+
+@router.get("/reports/stats", dependencies=[Depends(require_admin)])
+def report_stats():
+    return report_cache.stats()
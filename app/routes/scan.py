@@ -1,235 +1,680 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response, status
 from ..auth import get_current_user
 from ..database import scans_collection
-from ..ml_model import predict_scan
-from ..schemas import ScanOut
-from typing import List
+from ..ml_model import predict_tensor_async, predict_many_async, preprocess_upload_with_thumbnails, prediction_cache_key
+from ..explain_jobs import enqueue_explanation, explanation_status, scan_channel
+from ..reports import REPORT_META_PROJECTION, cached_report, report_version, report_filename, iter_bytes, export_query, iter_reports_zip
+from ..schemas import ScanOut, BatchScanItem, BatchScanOut
+from typing import List, Optional
 from bson import ObjectId, Binary
+from pymongo.errors import BulkWriteError
 from datetime import datetime
-import uuid, os, base64
-from fastapi.responses import FileResponse
-from app.utils.pdf_generator import generate_pdf_report
+import os, base64, json
+from fastapi.responses import StreamingResponse
 import asyncio
 from app.utils.thread_executor import run_in_thread
-import aiohttp
+from app.utils.prediction_cache import prediction_cache, image_digest
+from app.utils.admission import AdmissionController, QueueFull
+from app.utils.image_store import store_image, load_scan_image, delete_image, get_thumbnail, thumbnail_size_key, iter_image_chunks
+from app.utils.http_cache import (
+    IMMUTABLE, REVALIDATE, strong_etag, is_not_modified, not_modified_response, cached_bytes_response, cached_stream_response
+)
+from app.utils.report_cache import report_cache
+from app.utils.thumbnails import THUMBNAIL_SIZES
+from app.utils.explanation_store import (
+    EXPLANATION_KINDS, has_explanation, explanation_image, explanations_out
+)
+from app.utils.pubsub import events
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-SHAP_MICROSERVICE_URL = os.getenv("SHAP_MICROSERVICE_URL", "http://localhost:8001/explain")
-OCCL_MICROSERVICE_URL = os.getenv("OCCL_MICROSERVICE_URL", "http://localhost:8002/explain")
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "50"))
+BATCH_UPLOAD_CHUNK_SIZE = max(1, int(os.getenv("BATCH_UPLOAD_CHUNK_SIZE", "4")))  # images per admission slot
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "8"))
+UPLOAD_MAX_QUEUE = int(os.getenv("UPLOAD_MAX_QUEUE", "32"))
+UPLOAD_MAX_WAIT_S = float(os.getenv("UPLOAD_MAX_WAIT_S", "15"))
+UPLOAD_RETRY_AFTER_S = int(os.getenv("UPLOAD_RETRY_AFTER_S", "2"))
+SSE_HEARTBEAT_S = float(os.getenv("SSE_HEARTBEAT_S", "15"))
+SSE_MAX_DURATION_S = float(os.getenv("SSE_MAX_DURATION_S", "300"))
 
 
 router = APIRouter()
 
-readable_class_mapping = {
-    "nv": "Melanocytic Nevi",
-    "mel": "Melanoma",
-    "bkl": "Benign Keratosis-like Lesions",
-    "bcc": "Basal Cell Carcinoma",
-    "akiec": "Actinic Keratoses",
-    "vasc": "Vascular Lesions",
-    "df": "Dermatofibroma"
-}
-
-# directory for temporary files
-UPLOAD_DIR = "temp_uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-async def _background_explain_and_update(scan_id: str, image_path: str):
-    # 1. Call the explanation microservice and get base64 strings
-    result = await call_explanation_microservice(image_path)
+upload_admission = AdmissionController(
+    max_concurrency=UPLOAD_MAX_CONCURRENCY,
+    max_queue=UPLOAD_MAX_QUEUE,
+    max_wait_s=UPLOAD_MAX_WAIT_S,
+    retry_after_s=UPLOAD_RETRY_AFTER_S,
+)
 
-    shap_b64 = result.get("shap")
-    occ_b64  = result.get("occlusion")
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
 
-    # 2. Update MongoDB directly with those base64 values
-    await scans_collection.update_one(
-        {"_id": ObjectId(scan_id)},
-        {"$set": {
-            "explanations.shap_base64": shap_b64,
-            "explanations.occlusion_base64": occ_b64
-        }}
-    )
+async def _new_scan_doc(current_user, patient_name, patient_age, gender, scan_area, additional_info,
+                        image_bytes, image_sha256, filename, content_type, prediction_class, confidence_score,
+                        thumbnails: dict | None = None) -> dict:
+    # the image goes to GridFS; the scan document only references it
+    scan_id = ObjectId()
+    image_file_id = await store_image(image_bytes, filename, content_type, scan_id)
+    return {
+        "_id": scan_id,
+        "user_email": current_user["email"],
+        "patient_name": patient_name,
+        "patient_age": patient_age,
+        "gender": gender,
+        "scan_area": scan_area,
+        "additional_info": additional_info,
+        "uploaded_at": datetime.utcnow(),
+        "image_file_id": image_file_id,
+        "image_size": len(image_bytes),
+        "image_sha256": image_sha256,  # strong ETag for the raw image endpoint
+        "thumbnails": {size: Binary(data) for size, data in (thumbnails or {}).items()},
+        "image_filename": filename,
+        "image_content_type": content_type,
+        "prediction": {"class": prediction_class, "confidence": confidence_score},
+        "explanations": {"shap": None, "occlusion": None},
+        "content_version": 0,  # bumped on every later change that affects the PDF report
+    }
 
-    # 3. Cleanup the temp image file
+@asynccontextmanager
+async def _upload_slot():
+    # admission control: bounded concurrency + bounded wait queue, 503 when saturated
     try:
-        os.remove(image_path)
-    except OSError:
-        pass
-
-            
-async def call_explanation_microservice(image_path: str) -> dict:
-    results = {}
-
-    async def call_one(url: str, label: str):
-        try:
-            async with aiohttp.ClientSession() as session:
-                with open(image_path, 'rb') as f:
-                    form = aiohttp.FormData()
-                    form.add_field('file', f, filename="scan.jpg", content_type='image/jpeg')
-
-                    async with session.post(url, data=form) as resp:
-                        if resp.status == 200:
-                            data = await resp.json()
-                            results[label] = data.get(f"{label}_base64")
-                        else:
-                            print(f"[ERROR] {label.upper()} failed: {resp.status}")
-        except Exception as e:
-            print(f"[ERROR] Could not contact {label} microservice: {e}")
-
-    await asyncio.gather(
-        call_one(SHAP_MICROSERVICE_URL, "shap"),
-        call_one(OCCL_MICROSERVICE_URL, "occlusion")
-    )
-    return results
+        async with upload_admission.slot():
+            yield
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Scan service is busy, please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
 
 @router.post("/upload-scan", response_model=ScanOut)
 async def upload_scan(
-    background_tasks: BackgroundTasks,
+    request: Request,
     patient_name: str = Form(...),
     patient_age: int = Form(...),
     gender: str = Form(...),
     scan_area: str = Form(...),
     additional_info: str = Form(""),
     image: UploadFile = File(...),
+    image_format: str = Query("base64", pattern="^(base64|url)$"),
     current_user: dict = Depends(get_current_user)
 ):
     # validate file type
     if not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Only image uploads are allowed.")
 
-    # read and save image
-    image_bytes = await image.read()
-    temp_filename = f"{uuid.uuid4().hex}_{image.filename}"
-    temp_path = os.path.join(UPLOAD_DIR, temp_filename)
-    with open(temp_path, "wb") as f:
-        f.write(image_bytes)
-
-    # make prediction
-    prediction_class, confidence_score = predict_scan(temp_path)
-
-    # prepare initial document (explanations pending)
-    scan_doc = {
-        "user_email": current_user["email"],
-        "patient_name": patient_name,
-        "patient_age": patient_age,
-        "gender": gender,
-        "scan_area": scan_area,
-        "additional_info": additional_info,
-        "uploaded_at": datetime.utcnow(),
-        "image_data": Binary(image_bytes),
-        "image_filename": image.filename,
-        "image_content_type": image.content_type,
-        "prediction": {"class": prediction_class, "confidence": confidence_score},
-        "explanations": {"shap_base64": None, "occlusion_base64": None}
-    }
-    result = await scans_collection.insert_one(scan_doc)
-    scan_id = str(result.inserted_id)
-
-    # schedule explanation in background
-    background_tasks.add_task(_background_explain_and_update, scan_id, temp_path)
+    async with _upload_slot():
+        # read image; it is decoded in memory, never written to disk
+        image_bytes = await image.read()
+
+        # decode once for both the model tensor and the thumbnails (worker thread, off the loop)
+        img_tensor, thumbnails = await run_in_thread(preprocess_upload_with_thumbnails, image_bytes)
+        # hashed once: the digest is both the image ETag and the prediction cache key
+        digest = await run_in_thread(image_digest, image_bytes)
+
+        # make prediction (re-uploads of the same image hit the cache; nothing is cached until a model is active)
+        cache_key = prediction_cache_key(digest)
+        cached = await prediction_cache.get(cache_key) if cache_key else None
+        if cached and cached.get("prediction"):
+            prediction_class, confidence_score = cached["prediction"]
+        else:
+            prediction_class, confidence_score = await predict_tensor_async(img_tensor)
+            if cache_key and prediction_class not in ("Unknown", "Error"):
+                await prediction_cache.update(cache_key, prediction=[prediction_class, confidence_score])
+
+        # prepare initial document (explanations pending)
+        scan_doc = await _new_scan_doc(
+            current_user, patient_name, patient_age, gender, scan_area, additional_info,
+            image_bytes, digest, image.filename, image.content_type, prediction_class, confidence_score,
+            thumbnails
+        )
+        try:
+            result = await scans_collection.insert_one(scan_doc)
+        except Exception:
+            # don't leave the GridFS image behind without a scan referencing it
+            await delete_image(scan_doc["image_file_id"])
+            raise
+        scan_id = str(result.inserted_id)
+        if image_format == "url":
+            image_fields = {"image_base64": None, **_scan_urls(request, scan_id, None)}
+        else:
+            image_fields = {"image_base64": await run_in_thread(_b64encode, image_bytes)}
+
+    # queue explanations (durable; processed by the explanation workers)
+    await enqueue_explanation(scan_id, cache_key)
 
     # return initial response with image data
     return ScanOut(**{
         **scan_doc,
         "_id": scan_id,
-        "image_base64": base64.b64encode(image_bytes).decode()
+        "explanations": explanations_out(scan_doc["explanations"]),
+        **image_fields
     })
 
+async def _insert_scan_docs(docs: list) -> list:
+    """
+    insert_many with per-document outcomes: None for a stored scan, an error
+    message otherwise. The GridFS images of documents that were not stored are deleted.
+    """
+    failed = {}
+    try:
+        await scans_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            failed[err["index"]] = "Could not save scan."
+            print(f"[ERROR] Batch upload insert failed for {docs[err['index']]['_id']}: {err.get('errmsg')}")
+    except Exception as e:
+        print(f"[ERROR] Batch upload insert failed: {e}")
+        failed = {i: "Could not save scan." for i in range(len(docs))}
+    await asyncio.gather(*(delete_image(docs[i]["image_file_id"]) for i in failed))
+    return [failed.get(i) for i in range(len(docs))]
+
+@router.post("/upload-scans", response_model=BatchScanOut)
+async def upload_scans(
+    patient_name: str = Form(...),
+    patient_age: int = Form(...),
+    gender: str = Form(...),
+    scan_area: str = Form(...),
+    additional_info: str = Form(""),
+    images: List[UploadFile] = File(...),
+    current_user: dict = Depends(get_current_user)
+):
+    if len(images) > BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_UPLOAD_MAX_FILES} images per upload.")
+
+    results = [BatchScanItem(filename=img.filename) for img in images]
+
+    async def process_chunk(chunk: list):
+        payloads = {}  # i -> (image_bytes, digest, cache_key)
+
+        # 1. read + validate, then hash and decode the chunk's images concurrently
+        raw = {}
+        for i in chunk:
+            img = images[i]
+            if not (img.content_type or "").startswith("image/"):
+                results[i].error = "Only image uploads are allowed."
+                continue
+            raw[i] = await img.read()
+        digests = await asyncio.gather(*(run_in_thread(image_digest, image_bytes) for image_bytes in raw.values()))
+        for (i, image_bytes), digest in zip(raw.items(), digests):
+            payloads[i] = (image_bytes, digest, prediction_cache_key(digest))
+
+        accepted = list(payloads)
+        keyed = [i for i in accepted if payloads[i][2]]
+        cached = await asyncio.gather(*(prediction_cache.get(payloads[i][2]) for i in keyed))
+        predictions = {i: c["prediction"] for i, c in zip(keyed, cached) if c and c.get("prediction")}
+
+        decoded = await asyncio.gather(
+            *(run_in_thread(preprocess_upload_with_thumbnails, payloads[i][0]) for i in accepted), return_exceptions=True
+        )
+        thumbnails = {}
+        valid = []
+        for i, item in zip(accepted, decoded):
+            if isinstance(item, Exception):
+                print(f"[ERROR] Batch upload could not decode {images[i].filename}: {item}")
+                item = (None, {})
+            tensor, thumbs = item
+            if tensor is None:
+                results[i].error = "Could not decode image."
+                predictions.pop(i, None)
+                continue
+            thumbnails[i] = thumbs
+            if i not in predictions:
+                valid.append((i, tensor))
+
+        # 2. one batched forward pass (merged with concurrent chunks by the batcher)
+        if valid:
+            labels = await predict_many_async([t for _, t in valid])
+            for (i, _), (label, confidence) in zip(valid, labels):
+                predictions[i] = [label, confidence]
+                if payloads[i][2] and label not in ("Unknown", "Error"):
+                    await prediction_cache.update(payloads[i][2], prediction=[label, confidence])
+
+        # 3. single insert_many for the chunk's scan documents
+        built = await asyncio.gather(*(
+            _new_scan_doc(
+                current_user, patient_name, patient_age, gender, scan_area, additional_info,
+                *payloads[i][:2], images[i].filename, images[i].content_type, *predictions[i],
+                thumbnails[i]
+            )
+            for i in accepted if i in predictions
+        ), return_exceptions=True)
+        order, docs = [], []
+        for i, doc in zip([i for i in accepted if i in predictions], built):
+            if isinstance(doc, Exception):
+                print(f"[ERROR] Batch upload could not store {images[i].filename}: {doc}")
+                results[i].error = "Could not save scan."
+                continue
+            order.append(i)
+            docs.append(doc)
+        if not docs:
+            return
+        errors = await _insert_scan_docs(docs)
+        stored = []
+        for i, doc, error in zip(order, docs, errors):
+            if error:
+                results[i].error = error
+                continue
+            scan_id = str(doc["_id"])
+            # images are not echoed back in batch responses; fetch them per scan if needed
+            results[i].scan = ScanOut(**{
+                **doc, "_id": scan_id, "image_base64": None, "explanations": explanations_out(doc["explanations"])
+            })
+            stored.append((scan_id, payloads[i][2]))
+        await asyncio.gather(*(enqueue_explanation(scan_id, cache_key) for scan_id, cache_key in stored))
+
+    async def admitted_chunk(chunk: list) -> bool:
+        # each chunk takes its own admission slot, so a large batch counts against
+        # UPLOAD_MAX_CONCURRENCY like the equivalent single uploads would
+        try:
+            async with upload_admission.slot():
+                await process_chunk(chunk)
+        except QueueFull:
+            for i in chunk:
+                results[i].error = "Scan service is busy, please retry shortly."
+            return False
+        return True
+
+    chunks = [list(range(start, min(start + BATCH_UPLOAD_CHUNK_SIZE, len(images))))
+              for start in range(0, len(images), BATCH_UPLOAD_CHUNK_SIZE)]
+    admitted = await asyncio.gather(*(admitted_chunk(chunk) for chunk in chunks))
+    if chunks and not any(admitted):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Scan service is busy, please retry shortly.",
+            headers={"Retry-After": str(upload_admission.retry_after_s)},
+        )
+
+    succeeded = sum(1 for r in results if r.scan is not None)
+    return BatchScanOut(total=len(results), succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+# fields a client may ask /my-scans for; image and explanation blobs are never listed
+SCAN_LIST_FIELDS = {
+    "patient_name", "patient_age", "gender", "scan_area", "additional_info",
+    "uploaded_at", "image_filename", "prediction",
+}
+SCAN_LIST_DEFAULT_FIELDS = ("patient_name", "prediction")
+SCAN_LIST_MAX_LIMIT = 100
+
+def _encode_cursor(doc: dict) -> str:
+    payload = json.dumps({"t": doc["uploaded_at"].isoformat(), "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def _decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/my-scans", response_model=List[dict])
-async def get_user_scans(current_user: dict = Depends(get_current_user)):
+async def get_user_scans(
+    response: Response,
+    limit: int = Query(20, ge=1, le=SCAN_LIST_MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = Query(None, description="comma-separated subset of the listable fields"),
+    current_user: dict = Depends(get_current_user)
+):
+    selected = SCAN_LIST_DEFAULT_FIELDS
+    if fields:
+        selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+        unknown = set(selected) - SCAN_LIST_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    # keyset pagination on (uploaded_at, _id), served by the user_email_uploaded_at_id index
+    direction = -1 if order == "desc" else 1
+    query = {"user_email": current_user["email"]}
+    if cursor:
+        after_t, after_id = _decode_cursor(cursor)
+        op = "$lt" if direction == -1 else "$gt"
+        query["$or"] = [
+            {"uploaded_at": {op: after_t}},
+            {"uploaded_at": after_t, "_id": {op: after_id}},
+        ]
+
+    projection = {f: 1 for f in selected}
+    projection["uploaded_at"] = 1  # needed for the cursor
+    docs = await (
+        scans_collection.find(query, projection)
+        .sort([("uploaded_at", direction), ("_id", direction)])
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(docs[-1])
+
     scans = []
-    cursor = scans_collection.find({"user_email": current_user["email"]})
-    async for doc in cursor:
-        scans.append({
-            "_id": str(doc["_id"]),
-            "patient_name": doc.get("patient_name", "N/A"),
-            "prediction": {
-                "class": doc.get("prediction", {}).get("class", "N/A"),
-                "confidence": doc.get("prediction", {}).get("confidence", 0.0)
-            }
-        })
+    for doc in docs:
+        item = {"_id": str(doc["_id"])}
+        for f in selected:
+            if f == "prediction":
+                item["prediction"] = {
+                    "class": doc.get("prediction", {}).get("class", "N/A"),
+                    "confidence": doc.get("prediction", {}).get("confidence", 0.0)
+                }
+            elif f == "patient_name":
+                item["patient_name"] = doc.get("patient_name", "N/A")
+            elif f == "uploaded_at":
+                item["uploaded_at"] = doc["uploaded_at"].isoformat() if doc.get("uploaded_at") else None
+            else:
+                item[f] = doc.get(f)
+        scans.append(item)
     return scans
 
+def export_response(query: dict, user: dict | None, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        iter_reports_zip(query, user),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+# registered before /my-scans/{scan_id} so "export" is not taken for a scan id
+@router.get("/my-scans/export")
+async def export_scan_reports(
+    patient_name: Optional[str] = Query(None, description="exact patient name, case-insensitive"),
+    date_from: Optional[datetime] = Query(None, description="uploaded at or after (ISO 8601)"),
+    date_to: Optional[datetime] = Query(None, description="uploaded before (ISO 8601)"),
+    prediction: Optional[str] = Query(None, description="predicted class code, e.g. mel"),
+    scan_area: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """ZIP of the PDF reports of every matching scan, streamed while the reports are rendered."""
+    query = {**export_query(patient_name, date_from, date_to, prediction, scan_area), "user_email": current_user["email"]}
+    return export_response(query, current_user, f"DermaXplain_Reports_{datetime.utcnow():%Y%m%d}.zip")
+
+def _scan_urls(request: Request, scan_id: str, explanations: dict | None) -> dict:
+    # relative URLs of the binary endpoints, for clients that asked for image_format=url
+    explanations = explanations or {}
+    return {
+        "image_url": request.app.url_path_for("get_scan_image", scan_id=scan_id),
+        "explanation_urls": {
+            f"{kind}_url": (
+                request.app.url_path_for("get_scan_explanation", scan_id=scan_id, kind=kind)
+                if has_explanation(explanations, kind) else None
+            )
+            for kind in EXPLANATION_KINDS
+        },
+    }
+
 @router.get("/my-scans/{scan_id}", response_model=ScanOut)
-async def get_scan_detail(scan_id: str, current_user: dict = Depends(get_current_user)):
+async def get_scan_detail(
+    scan_id: str,
+    request: Request,
+    image_format: str = Query("base64", pattern="^(base64|url)$",
+                              description="'url' returns links to the binary endpoints instead of inline base64"),
+    current_user: dict = Depends(get_current_user)
+):
     if not ObjectId.is_valid(scan_id):
         raise HTTPException(status_code=400, detail="Invalid scan ID")
 
-    doc = await scans_collection.find_one({
-        "_id": ObjectId(scan_id),
-        "user_email": current_user["email"]
-    })
+    projection = {"image_data": 0, "thumbnails": 0}
+    if image_format == "url":
+        projection.update({f"explanations.{kind}.data": 0 for kind in EXPLANATION_KINDS})
+    doc = await scans_collection.find_one(
+        {"_id": ObjectId(scan_id), "user_email": current_user["email"]}, projection
+    )
     if not doc:
         raise HTTPException(status_code=404, detail="Scan not found")
 
-    # base64 encode image and prepare explanations
-    raw = doc.get("image_data")
-    image_b64 = None
-    if raw:
-        image_bytes = raw if isinstance(raw, (bytes, bytearray)) else raw.value
-        image_b64 = base64.b64encode(image_bytes).decode()
-
     explanations = doc.get("explanations", {})
+    fields = {k: v for k, v in doc.items() if k not in ["image_file_id", "_id"]}
+
+    if image_format == "url":
+        return ScanOut(**{
+            **fields,
+            "_id": str(doc["_id"]),
+            "image_base64": None,
+            "explanations": {"shap_base64": None, "occlusion_base64": None},
+            **_scan_urls(request, scan_id, explanations),
+        })
+
+    # base64 encode image and prepare explanations
+    if not doc.get("image_file_id"):
+        doc = await scans_collection.find_one({"_id": doc["_id"]}, {"image_data": 1})
+    image_bytes = await load_scan_image(doc)
+    image_b64 = await run_in_thread(_b64encode, image_bytes) if image_bytes else None
 
     return ScanOut(**{
-        **{k: v for k, v in doc.items() if k not in ["image_data", "_id"]},
-        "_id": str(doc["_id"]),  # <-- ✅ ensure it's a string
+        **fields,
+        "_id": scan_id,  # <-- ✅ ensure it's a string
         "image_base64": image_b64,
-        "explanations": {
-            "shap_base64": explanations.get("shap_base64"),
-            "occlusion_base64": explanations.get("occlusion_base64")
-        }
+        "explanations": explanations_out(explanations)
     })
 
+async def scan_image_response(request: Request, query: dict) -> Response:
+    """Original upload, streamed from GridFS, with a strong content-hash ETag."""
+    doc = await scans_collection.find_one(
+        query, {"image_file_id": 1, "image_sha256": 1, "image_size": 1, "image_content_type": 1}
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    media_type = doc.get("image_content_type") or "application/octet-stream"
+
+    if doc.get("image_file_id") and doc.get("image_sha256"):
+        return cached_stream_response(
+            request, iter_image_chunks(doc["image_file_id"]), media_type,
+            etag=strong_etag(doc["image_sha256"]), cache_control=IMMUTABLE, content_length=doc.get("image_size")
+        )
+
+    # scans stored before image hashes existed: hash once and remember it
+    full = await scans_collection.find_one({"_id": doc["_id"]}, {"image_file_id": 1, "image_data": 1})
+    image_bytes = await load_scan_image(full)
+    if not image_bytes:
+        raise HTTPException(status_code=404, detail="Image not found")
+    digest = await run_in_thread(image_digest, image_bytes)
+    await scans_collection.update_one({"_id": doc["_id"]}, {"$set": {"image_sha256": digest}})
+    return cached_bytes_response(request, image_bytes, media_type, IMMUTABLE, strong_etag(digest))
+
+async def scan_explanation_response(request: Request, query: dict, kind: str) -> Response:
+    if kind not in EXPLANATION_KINDS:
+        raise HTTPException(status_code=404, detail="Unknown explanation type")
+    # every explanation write bumps content_version, so the ETag is known before the image is loaded
+    meta = await scans_collection.find_one(query, {"content_version": 1})
+    if not meta:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    etag = _explanation_etag(meta, kind)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, REVALIDATE)
+
+    doc = await scans_collection.find_one(
+        {"_id": meta["_id"]}, {"content_version": 1, f"explanations.{kind}": 1, f"explanations.{kind}_base64": 1}
+    )
+    image = explanation_image(doc.get("explanations"), kind) if doc else None
+    if image is None:
+        raise HTTPException(status_code=404, detail="Explanation not ready")
+    data, media_type = image
+    # explanations can still be filled in / regenerated, so clients revalidate
+    return cached_bytes_response(request, data, media_type, REVALIDATE, _explanation_etag(doc, kind))
+
+def _explanation_etag(doc: dict, kind: str) -> str:
+    return strong_etag(f"{doc['_id']}-{kind}-v{doc.get('content_version', 0)}")
+
+def thumbnail_response(request: Request, data: bytes | None) -> Response:
+    if data is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    # thumbnails never change for a given scan id, so browsers and CDNs may keep them indefinitely
+    return cached_bytes_response(request, data, "image/webp", IMMUTABLE)
+
+@router.get("/my-scans/{scan_id}/image")
+async def get_scan_image(scan_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    if not ObjectId.is_valid(scan_id):
+        raise HTTPException(status_code=400, detail="Invalid scan ID")
+    return await scan_image_response(request, {"_id": ObjectId(scan_id), "user_email": current_user["email"]})
+
+# enough to tell which explanations exist without loading their bytes
+EXPLANATION_READY_PROJECTION = {
+    **{f"explanations.{kind}.media_type": 1 for kind in EXPLANATION_KINDS},
+    **{f"explanations.{kind}_base64": 1 for kind in EXPLANATION_KINDS},
+}
+
+async def _explanations_ready(query: dict) -> dict | None:
+    doc = await scans_collection.find_one(query, EXPLANATION_READY_PROJECTION)
+    if not doc:
+        return None
+    return {kind: has_explanation(doc.get("explanations"), kind) for kind in EXPLANATION_KINDS}
+
+@router.get("/my-scans/{scan_id}/explanation-status")
+async def get_explanation_status(scan_id: str, current_user: dict = Depends(get_current_user)):
+    if not ObjectId.is_valid(scan_id):
+        raise HTTPException(status_code=400, detail="Invalid scan ID")
+    ready = await _explanations_ready({"_id": ObjectId(scan_id), "user_email": current_user["email"]})
+    if ready is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+
+    status_doc = await explanation_status(scan_id)
+    if status_doc is None:
+        # scans explained before the job queue existed (or whose job record expired)
+        status_doc = {"scan_id": scan_id, "status": "done" if all(ready.values()) else "unknown"}
+    status_doc["ready"] = ready
+    return status_doc
+
+async def _sse_explanations(scan_id: str, status: str, ready: dict, with_payload: bool) -> str:
+    body = {"scan_id": scan_id, "status": status, "ready": ready}
+    if with_payload:
+        doc = await scans_collection.find_one({"_id": ObjectId(scan_id)}, {"explanations": 1})
+        body["explanations"] = await run_in_thread(explanations_out, (doc or {}).get("explanations"))
+    return f"event: explanations\ndata: {json.dumps(body)}\n\n"
+
+async def _final_explanation_state(scan_id: str, query: dict) -> tuple[str, dict | None] | None:
+    """(status, ready) once the scan's explanations are done or its job failed; ("deleted", None) if the scan is gone."""
+    ready = await _explanations_ready(query)
+    if ready is None:
+        return "deleted", None
+    if all(ready.values()):
+        return "done", ready
+    job = await explanation_status(scan_id)
+    if job is not None and job["status"] == "failed":
+        return "failed", ready
+    return None
+
+@router.get("/my-scans/{scan_id}/events")
+async def scan_events(
+    scan_id: str,
+    request: Request,
+    include: str = Query("status", pattern="^(status|payload)$",
+                         description="'payload' also sends the base64 explanations with the event"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Server-sent events for one scan: an `explanations` event whenever the
+    explanation job stores results, ending with status `done` or `failed`.
+    Replaces polling GET /my-scans/{scan_id}.
+    """
+    if not ObjectId.is_valid(scan_id):
+        raise HTTPException(status_code=400, detail="Invalid scan ID")
+    query = {"_id": ObjectId(scan_id), "user_email": current_user["email"]}
+    if await _explanations_ready(query) is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    with_payload = include == "payload"
+
+    async def stream():
+        async with events.subscribe(scan_channel(scan_id)) as queue:
+            # results may have landed before the subscription existed
+            ready = await _explanations_ready(query)
+            if ready is None:
+                return
+            if all(ready.values()):
+                yield await _sse_explanations(scan_id, "done", ready, with_payload)
+                return
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + SSE_MAX_DURATION_S
+            while loop.time() < deadline:
+                if await request.is_disconnected():
+                    return
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    # the job may have finished in a process whose events never reach this one
+                    # (in-memory pub/sub with several API workers or external explanation workers)
+                    final = await _final_explanation_state(scan_id, query)
+                    if final is not None:
+                        if final[1] is not None:
+                            yield await _sse_explanations(scan_id, *final, with_payload)
+                        return
+                    yield ": keep-alive\n\n"  # comment line; keeps proxies from closing the stream
+                    continue
+                yield await _sse_explanations(scan_id, message["status"], message["ready"], with_payload)
+                if message["status"] in ("done", "failed"):
+                    return
+            yield "event: timeout\ndata: {}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/my-scans/{scan_id}/explanations/{kind}")
+async def get_scan_explanation(scan_id: str, kind: str, request: Request, current_user: dict = Depends(get_current_user)):
+    if not ObjectId.is_valid(scan_id):
+        raise HTTPException(status_code=400, detail="Invalid scan ID")
+    return await scan_explanation_response(request, {"_id": ObjectId(scan_id), "user_email": current_user["email"]}, kind)
+
+@router.get("/my-scans/{scan_id}/thumbnail")
+async def get_scan_thumbnail(
+    scan_id: str,
+    request: Request,
+    size: int = Query(min(THUMBNAIL_SIZES), description=f"one of {list(THUMBNAIL_SIZES)}"),
+    current_user: dict = Depends(get_current_user)
+):
+    if not ObjectId.is_valid(scan_id):
+        raise HTTPException(status_code=400, detail="Invalid scan ID")
+    size_key = thumbnail_size_key(size)
+    if size_key is None:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(THUMBNAIL_SIZES)}")
+
+    data = await get_thumbnail({"_id": ObjectId(scan_id), "user_email": current_user["email"]}, size_key)
+    return thumbnail_response(request, data)
+
 @router.delete("/my-scans/{scan_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_scan(scan_id: str, current_user: dict = Depends(get_current_user)):
     if not ObjectId.is_valid(scan_id):
         raise HTTPException(status_code=400, detail="Invalid scan ID")
 
-    result = await scans_collection.delete_one({
-        "_id": ObjectId(scan_id),
-        "user_email": current_user["email"]
-    })
-    if result.deleted_count == 0:
+    deleted = await scans_collection.find_one_and_delete(
+        {"_id": ObjectId(scan_id), "user_email": current_user["email"]},
+        projection={"image_file_id": 1}
+    )
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Scan not found or unauthorized")
+    await delete_image(deleted.get("image_file_id"))
+    await report_cache.invalidate(scan_id)
 
 @router.get("/my-scans/{scan_id}/download")
-async def download_scan_pdf(scan_id: str, user=Depends(get_current_user)):
+async def download_scan_pdf(scan_id: str, request: Request, user=Depends(get_current_user)):
     if not ObjectId.is_valid(scan_id):
         raise HTTPException(status_code=400, detail="Invalid scan ID")
 
-    doc = await scans_collection.find_one({
-        "_id": ObjectId(scan_id),
-        "user_email": user["email"]
-    })
-    if not doc:
+    meta = await scans_collection.find_one(
+        {"_id": ObjectId(scan_id), "user_email": user["email"]},
+        REPORT_META_PROJECTION
+    )
+    if not meta:
         raise HTTPException(status_code=404, detail="Scan not found")
-
-    # prepare data for PDF
-    raw = doc.get("image_data")
-    image_bytes = raw if isinstance(raw, (bytes, bytearray)) else raw.value
-    doc["image_base64"] = base64.b64encode(image_bytes).decode()
-    class_code = doc.get("prediction", {}).get("class", "")
-    doc["prediction"]["readable_name"] = readable_class_mapping.get(class_code, "Unknown")
-    doc["explanations"] = doc.get("explanations", {"shap_base64": None, "occlusion_base64": None})
-
-    # generate PDF synchronously (fast) and schedule cleanup
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    pdf_path = os.path.join(UPLOAD_DIR, f"report_{scan_id}.pdf")
-    generate_pdf_report(user, doc, pdf_path)
-
-    async def _cleanup_pdf():
-        await asyncio.sleep(10)
-        try:
-            os.remove(pdf_path)
-        except OSError:
-            pass
-    asyncio.create_task(_cleanup_pdf())
-
-    return FileResponse(
-        path=pdf_path,
-        filename=f"DermaXplain_Report_{scan_id}.pdf",
-        media_type="application/pdf"
+    return await report_response(request, user, meta)
+
+async def report_response(request: Request, user: dict, meta: dict) -> Response:
+    """PDF report for `meta` (REPORT_META_PROJECTION): 304 if the client's copy is current, else cached or rendered."""
+    version = report_version(user, meta)
+    etag = strong_etag(version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, REVALIDATE)  # answered without touching the cache or renderer
+    try:
+        pdf = await cached_report(user, meta, version)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return cached_stream_response(
+        request, iter_bytes(pdf), "application/pdf", etag,
+        cache_control=REVALIDATE, content_length=len(pdf),
+        headers={"Content-Disposition": f'attachment; filename="{report_filename(meta["_id"])}"'},
     )
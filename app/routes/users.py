@@ -3,6 +3,8 @@ from .. import schemas, auth, email
 from ..schemas import ForgotPasswordRequest
 from ..database import users_collection, scans_collection
 from ..auth import get_current_user
+from ..utils.image_store import delete_scan_images
+from ..utils.report_cache import report_cache
 from bson import ObjectId
 from passlib.context import CryptContext
 import secrets
@@ -61,7 +63,9 @@ async def delete_account(current_user: dict = Depends(get_current_user)):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found or already deleted")
 
+    scan_ids = await delete_scan_images({"user_email": current_user["email"]})
     await scans_collection.delete_many({"user_email": current_user["email"]})
+    await report_cache.invalidate_many(scan_ids)  # rendered PDFs hold patient data too
     email.send_deletion_email(to_email=current_user["email"], name=current_user["name"])
     return None
 
@@ -3,7 +3,7 @@ from typing import Optional, Any
 from bson import ObjectId
 from pydantic_core import core_schema
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 # ✅ Pydantic v2 compatible ObjectId
 class PyObjectId(ObjectId):
@@ -88,6 +88,9 @@ class ScanOut(BaseModel):
 
     # ✅ Add this block:
     explanations: Optional[Dict[str, Optional[str]]] = None  # keys: shap_base64, occlusion_base64
+    # set instead of the base64 fields when the client asks for image_format=url
+    image_url: Optional[str] = None
+    explanation_urls: Optional[Dict[str, Optional[str]]] = None  # keys: shap_url, occlusion_url
 
     class Config:
         from_attributes = True
@@ -95,5 +98,16 @@ class ScanOut(BaseModel):
         populate_by_name = True
         arbitrary_types_allowed = True
         
+class BatchScanItem(BaseModel):
+    filename: Optional[str] = None
+    scan: Optional[ScanOut] = None
+    error: Optional[str] = None
+
+class BatchScanOut(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BatchScanItem]
+
 class ForgotPasswordRequest(BaseModel):
     email: EmailStr
\ No newline at end of file
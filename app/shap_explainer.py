@@ -0,0 +1,121 @@
+"""
+In-process SHAP explainer.
+
+The explainer and its background dataset are built once per model version
+and reused across requests. Pending scans are grouped through an
+InferenceBatcher so several explanations share one shap_values() call.
+"""
+import base64
+import io
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import shap
+from PIL import Image
+from dotenv import load_dotenv
+
+from app.utils.inference_batcher import InferenceBatcher
+from app.utils.thread_executor import explain_executor, run_in_explain_thread
+
+load_dotenv()
+
+SHAP_BACKGROUND_DIR = os.getenv("SHAP_BACKGROUND_DIR")
+SHAP_BACKGROUND_SIZE = int(os.getenv("SHAP_BACKGROUND_SIZE", "32"))
+SHAP_MAX_BATCH_SIZE = int(os.getenv("SHAP_MAX_BATCH_SIZE", "8"))
+SHAP_MAX_WAIT_MS = float(os.getenv("SHAP_MAX_WAIT_MS", "200"))
+SHAP_RENDER_SIZE = int(os.getenv("SHAP_RENDER_SIZE", "256"))
+
+
+def build_background(input_shape, preprocess_fn) -> np.ndarray:
+    """
+    Background samples from SHAP_BACKGROUND_DIR when set (e.g. a slice of the
+    training set); otherwise an even spread of flat grey levels.
+    """
+    samples = []
+    if SHAP_BACKGROUND_DIR:
+        for path in sorted(Path(SHAP_BACKGROUND_DIR).rglob("*")):
+            if len(samples) >= SHAP_BACKGROUND_SIZE:
+                break
+            if path.is_file():
+                tensor = preprocess_fn(path.read_bytes())
+                if tensor is not None:
+                    samples.append(tensor[0])
+
+    if not samples:
+        levels = np.linspace(0, 255, SHAP_BACKGROUND_SIZE, dtype=np.float32)
+        return np.broadcast_to(levels[:, None, None, None], (SHAP_BACKGROUND_SIZE, *input_shape)).copy()
+    return np.stack(samples).astype(np.float32)
+
+
+class ShapExplainer:
+    def __init__(self, model, background: np.ndarray):
+        self.explainer = shap.GradientExplainer(model, background)
+
+    def top_class_values(self, img_tensor: np.ndarray) -> np.ndarray:
+        """(n, H, W, C) SHAP values for each image's top predicted class."""
+        values, _ = self.explainer.shap_values(img_tensor, ranked_outputs=1)
+        values = np.asarray(values[0] if isinstance(values, list) else values)
+        if values.ndim == img_tensor.ndim + 1:
+            values = values[..., 0]
+        return values.astype(np.float32, copy=False)
+
+
+_explainers: dict[str, ShapExplainer] = {}
+_explainers_lock = threading.Lock()
+
+
+def get_explainer(model, version: str, input_shape, preprocess_fn) -> ShapExplainer:
+    explainer = _explainers.get(version)
+    if explainer is None:
+        with _explainers_lock:
+            explainer = _explainers.get(version)
+            if explainer is None:
+                background = build_background(input_shape, preprocess_fn)
+                explainer = ShapExplainer(model, background)
+                _explainers.clear()  # only the active model version is kept
+                _explainers[version] = explainer
+                print(f"[INFO] Built SHAP explainer for model {version} ({len(background)} background samples)")
+    return explainer
+
+
+def render_shap(img: np.ndarray, values: np.ndarray, size: int = SHAP_RENDER_SIZE) -> bytes:
+    """Red (supports prediction) / blue (against) overlay on a greyscale copy of the scan."""
+    attribution = values.sum(axis=-1)
+    scale = np.abs(attribution).max()
+    norm = attribution / scale if scale > 0 else attribution
+
+    grey = np.clip(img, 0, 255).mean(axis=-1, keepdims=True) * 0.6
+    red = np.clip(norm, 0, 1)[..., None] * np.array([255, 0, 0], dtype=np.float32)
+    blue = np.clip(-norm, 0, 1)[..., None] * np.array([0, 80, 255], dtype=np.float32)
+    weight = np.abs(norm)[..., None]
+    rgb = grey * (1 - weight) + (red + blue) * weight
+
+    out = Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).resize((size, size), Image.BILINEAR)
+    buf = io.BytesIO()
+    out.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+class ShapService:
+    """Async front end: queue single-image requests, explain them in batches."""
+
+    def __init__(self, active_model_fn, input_shape, preprocess_fn):
+        self.active_model_fn = active_model_fn  # -> (version, model)
+        self.input_shape = input_shape
+        self.preprocess_fn = preprocess_fn
+        self.batcher = InferenceBatcher(
+            self._explain_batch, max_batch_size=SHAP_MAX_BATCH_SIZE, max_wait_ms=SHAP_MAX_WAIT_MS, executor=explain_executor
+        )
+
+    def _explain_batch(self, img_tensor: np.ndarray) -> np.ndarray:
+        version, model = self.active_model_fn()
+        explainer = get_explainer(model, version, self.input_shape, self.preprocess_fn)
+        return explainer.top_class_values(img_tensor)
+
+    async def explain(self, img_tensor: np.ndarray) -> str:
+        """(1, H, W, C) tensor -> base64 PNG, the same payload the SHAP microservice returned."""
+        values = await self.batcher.submit(img_tensor)
+        png = await run_in_explain_thread(render_shap, img_tensor[0], values[0])
+        return base64.b64encode(png).decode()
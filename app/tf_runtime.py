@@ -0,0 +1,80 @@
+"""
+TensorFlow runtime setup and the compiled inference path.
+
+`model.predict` goes through Keras' data adapter and callback machinery on
+every call, which dominates at batch size 1. `compiled_predict` wraps the
+model in a tf.function with a fixed input signature (optionally XLA-compiled)
+that is traced once and then called directly.
+"""
+import os
+import threading
+import weakref
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", "0"))  # 0 = TensorFlow default
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "0"))
+TF_JIT_COMPILE = os.getenv("TF_JIT_COMPILE", "false").lower() in ("1", "true", "yes")
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure_threads():
+    """Apply thread-pool sizes; must run before TensorFlow executes its first op."""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        import tensorflow as tf
+        try:
+            if TF_INTRA_OP_THREADS:
+                tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+            if TF_INTER_OP_THREADS:
+                tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+        except RuntimeError as e:
+            print(f"[WARN] TensorFlow thread settings ignored, runtime already initialized: {e}")
+        _configured = True
+
+
+# weak keys: a model dropped by the registry (hot-swap) takes its compiled function with it
+_compiled: "weakref.WeakKeyDictionary[object, object]" = weakref.WeakKeyDictionary()
+_compiled_lock = threading.Lock()
+
+
+def compiled_predict(model, input_shape):
+    """Return the (cached) compiled forward function for `model`."""
+    serve = _compiled.get(model)
+    if serve is not None:
+        return serve
+
+    import tensorflow as tf
+
+    with _compiled_lock:
+        serve = _compiled.get(model)
+        if serve is not None:
+            return serve
+
+        # the function must not hold the model itself, or its cache entry could never be dropped
+        model_ref = weakref.ref(model)
+
+        @tf.function(
+            input_signature=[tf.TensorSpec(shape=[None, *input_shape], dtype=tf.float32)],
+            jit_compile=TF_JIT_COMPILE,
+            reduce_retracing=True,
+        )
+        def serve(x):
+            return model_ref()(x, training=False)
+
+        _compiled[model] = serve
+        return serve
+
+
+def warm_compiled(model, input_shape, batch_sizes):
+    """Trace once and run every batch size we serve, so XLA (if on) compiles each shape up front."""
+    serve = compiled_predict(model, input_shape)
+    for n in sorted(set(batch_sizes)):
+        serve(np.zeros((n, *input_shape), dtype=np.float32))
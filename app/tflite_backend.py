@@ -0,0 +1,173 @@
+"""
+TFLite inference backend for the Keras classifier.
+
+The Keras model is converted once per (model version, quantization) and the
+flatbuffer is cached under app/model/tflite_cache/. Each worker thread gets
+its own interpreter, since tf.lite.Interpreter is not thread-safe.
+
+Validate a conversion against the Keras path:
+
+    python -m app.tflite_backend path/to/validation_folder --quantization int8
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+CACHE_DIR = Path(__file__).resolve().parent / "model" / "tflite_cache"
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", "1"))
+
+
+def convert_keras_model(keras_model, quantization: str = "none") -> bytes:
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATION_MODES}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        # dynamic-range: int8 weights, float activations, no calibration set needed
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    return converter.convert()
+
+
+def load_or_convert(keras_model, version: str, quantization: str = "none") -> bytes:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cache_path = CACHE_DIR / f"{version}.{quantization}.tflite"
+    if cache_path.is_file():
+        return cache_path.read_bytes()
+
+    start = time.perf_counter()
+    content = convert_keras_model(keras_model, quantization)
+    # unique temp name: several worker processes may convert the same version at once
+    with tempfile.NamedTemporaryFile(dir=CACHE_DIR, prefix=cache_path.name, suffix=".tmp", delete=False) as tmp:
+        tmp.write(content)
+    try:
+        os.replace(tmp.name, cache_path)
+    except OSError:
+        os.unlink(tmp.name)
+        raise
+    print(f"[INFO] Converted model {version} to TFLite ({quantization}) "
+          f"in {time.perf_counter() - start:.1f}s -> {cache_path}")
+    return content
+
+
+class TFLiteBackend:
+    def __init__(self, model_content: bytes, num_threads: int = TFLITE_NUM_THREADS):
+        self.model_content = model_content
+        self.num_threads = num_threads
+        self._local = threading.local()
+
+    def _interpreter(self, batch_size: int):
+        local = self._local
+        interp = getattr(local, "interpreter", None)
+        if interp is None:
+            interp = tf.lite.Interpreter(model_content=self.model_content, num_threads=self.num_threads)
+            local.interpreter = interp
+            local.batch_size = None
+            local.input_index = interp.get_input_details()[0]["index"]
+            local.output_index = interp.get_output_details()[0]["index"]
+
+        if local.batch_size != batch_size:
+            shape = list(interp.get_input_details()[0]["shape"])
+            shape[0] = batch_size
+            interp.resize_tensor_input(local.input_index, shape)
+            interp.allocate_tensors()
+            local.batch_size = batch_size
+        return interp, local.input_index, local.output_index
+
+    def predict(self, img_tensor: np.ndarray) -> np.ndarray:
+        interp, input_index, output_index = self._interpreter(len(img_tensor))
+        interp.set_tensor(input_index, np.ascontiguousarray(img_tensor, dtype=np.float32))
+        interp.invoke()
+        return interp.get_tensor(output_index).copy()
+
+
+_backends: dict[tuple[str, str], TFLiteBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(keras_model, version: str, quantization: str = "none") -> TFLiteBackend:
+    """One backend per (model version, quantization); rebuilt automatically after a model swap."""
+    key = (version, quantization)
+    backend = _backends.get(key)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(key)
+            if backend is None:
+                backend = TFLiteBackend(load_or_convert(keras_model, version, quantization))
+                # drop interpreters for versions that are no longer active
+                _backends.clear()
+                _backends[key] = backend
+    return backend
+
+
+def agreement_report(folder, quantization: str = "none") -> dict:
+    """
+    Run every image under `folder` through both the Keras and the TFLite path.
+    If images sit in sub-folders named after class codes (nv, mel, ...), the
+    accuracy of each path is reported as well.
+    """
+    from app.ml_model import registry, preprocess_image, reverse_label_mapping
+
+    version, keras_model = registry.get_active()
+    backend = TFLiteBackend(load_or_convert(keras_model, version, quantization))
+
+    total = agree = labelled = keras_correct = tflite_correct = 0
+    max_abs_diff = 0.0
+    keras_ms = tflite_ms = 0.0
+
+    for path in sorted(Path(folder).rglob("*")):
+        if not path.is_file():
+            continue
+        tensor = preprocess_image(str(path))
+        if tensor is None:
+            continue
+
+        start = time.perf_counter()
+        k = keras_model.predict(tensor, verbose=0)[0]
+        keras_ms += (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        t = backend.predict(tensor)[0]
+        tflite_ms += (time.perf_counter() - start) * 1000
+
+        total += 1
+        agree += int(np.argmax(k) == np.argmax(t))
+        max_abs_diff = max(max_abs_diff, float(np.max(np.abs(k - t))))
+
+        true_idx = reverse_label_mapping.get(path.parent.name)
+        if true_idx is not None:
+            labelled += 1
+            keras_correct += int(np.argmax(k) == true_idx)
+            tflite_correct += int(np.argmax(t) == true_idx)
+
+    return {
+        "quantization": quantization,
+        "model_version": version,
+        "tflite_size_bytes": len(backend.model_content),
+        "images": total,
+        "top1_agreement": round(agree / total, 4) if total else None,
+        "max_abs_prob_diff": round(max_abs_diff, 6),
+        "keras_accuracy": round(keras_correct / labelled, 4) if labelled else None,
+        "tflite_accuracy": round(tflite_correct / labelled, 4) if labelled else None,
+        "keras_ms_per_image": round(keras_ms / total, 3) if total else None,
+        "tflite_ms_per_image": round(tflite_ms / total, 3) if total else None,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Compare TFLite predictions with the Keras model.")
+    parser.add_argument("folder", help="folder of validation images (optionally in class-code sub-folders)")
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES, default="none")
+    args = parser.parse_args()
+
+    print(json.dumps(agreement_report(args.folder, args.quantization), indent=2))
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from app.utils.stats import LatencyWindow
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("upload queue is full")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounds how much upload work runs at once. At most `max_concurrency`
+    requests are processed; up to `max_queue` more may wait for a slot
+    (for at most `max_wait_s`). Anything beyond that is rejected right away
+    so the caller can answer 503 + Retry-After instead of piling up work.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait_s: float, retry_after_s: int = 2, history: int = 512):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.retry_after_s = retry_after_s
+
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waits = LatencyWindow(history)  # ms spent waiting for a slot
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._sem.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self.retry_after_s)
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise QueueFull(self.retry_after_s)
+        finally:
+            self.waiting -= 1
+
+        self._waits.add((time.perf_counter() - start) * 1000)
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            **self._waits.summary("wait_ms"),
+        }
@@ -0,0 +1,134 @@
+"""
+Explanation images (SHAP / occlusion) are stored as recompressed binary
+subdocuments on the scan:
+
+    explanations.shap = {"data": Binary, "media_type": "image/webp", "original_size": 48213}
+
+Scans written before this keep `explanations.<kind>_base64` strings (the PNG
+as returned by the explainer); every reader goes through explanation_image()/
+explanations_out(), which handle both shapes. Base64 is only produced for
+responses that still embed it.
+"""
+import base64
+import io
+import os
+import re
+
+from bson import Binary
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# WEBP (default) or JPEG are lossy at EXPLANATION_QUALITY; PNG re-encodes losslessly
+EXPLANATION_FORMAT = os.getenv("EXPLANATION_FORMAT", "WEBP").upper()
+EXPLANATION_QUALITY = int(os.getenv("EXPLANATION_QUALITY", "80"))
+
+EXPLANATION_KINDS = ("shap", "occlusion")
+MEDIA_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+
+_DATA_URI_PREFIX = re.compile(r"^data:image/[a-zA-Z+.-]+;base64,")
+
+
+def sniff_media_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def decode_b64_image(b64: str) -> bytes:
+    b64 = _DATA_URI_PREFIX.sub("", b64.strip())
+    return base64.b64decode(b64 + "=" * (-len(b64) % 4))
+
+
+def recompress(data: bytes, fmt: str = EXPLANATION_FORMAT, quality: int = EXPLANATION_QUALITY) -> tuple[bytes, str]:
+    """Re-encode an explanation image; the original is kept if re-encoding doesn't make it smaller."""
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    if fmt == "JPEG" and img.mode != "RGB":
+        # no alpha in JPEG: flatten onto white like matplotlib's default figure background
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format="PNG", optimize=True)
+    elif fmt == "WEBP":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format=fmt, quality=quality, optimize=True)
+    out = buf.getvalue()
+    if len(out) >= len(data):
+        return data, sniff_media_type(data)
+    return out, MEDIA_TYPES.get(fmt, sniff_media_type(out))
+
+
+def pack_explanation(value) -> dict | None:
+    """
+    Stored form of one explanation. Accepts the explainer's base64 string (or
+    an already packed dict, e.g. from the prediction cache). CPU-bound: call
+    through run_in_thread.
+    """
+    if not value:
+        return None
+    if isinstance(value, dict):
+        return value
+    original = decode_b64_image(value)
+    data, media_type = recompress(original)
+    return {"data": Binary(data), "media_type": media_type, "original_size": len(original)}
+
+
+def pack_explanations(results: dict) -> dict:
+    return {kind: pack_explanation(results.get(kind)) for kind in EXPLANATION_KINDS}
+
+
+def explanation_update(packed: dict) -> dict:
+    """
+    Mongo update storing the packed explanations that are present (a missing
+    one never overwrites an earlier result), dropping their legacy base64
+    fields and bumping the scan's content_version.
+    """
+    present = [kind for kind in EXPLANATION_KINDS if packed.get(kind)]
+    update = {"$set": {f"explanations.{kind}": packed[kind] for kind in present}}
+    if present:
+        update["$unset"] = {f"explanations.{kind}_base64": "" for kind in present}
+        # invalidates cached PDF reports of the scan (see app/reports.py)
+        update["$inc"] = {"content_version": 1}
+    return update
+
+
+def has_explanation(explanations: dict | None, kind: str) -> bool:
+    explanations = explanations or {}
+    return bool(explanations.get(kind) or explanations.get(f"{kind}_base64"))
+
+
+def explanation_image(explanations: dict | None, kind: str) -> tuple[bytes, str] | None:
+    explanations = explanations or {}
+    packed = explanations.get(kind)
+    if packed and packed.get("data"):
+        return bytes(packed["data"]), packed.get("media_type") or sniff_media_type(packed["data"])
+    legacy = explanations.get(f"{kind}_base64")
+    if legacy:
+        data = decode_b64_image(legacy)
+        return data, sniff_media_type(data)
+    return None
+
+
+def explanation_b64(explanations: dict | None, kind: str) -> str | None:
+    explanations = explanations or {}
+    packed = explanations.get(kind)
+    if packed and packed.get("data"):
+        return base64.b64encode(packed["data"]).decode()
+    return explanations.get(f"{kind}_base64")
+
+
+def explanations_out(explanations: dict | None) -> dict:
+    """The `explanations` block of API responses and PDF reports: {"shap_base64": ..., "occlusion_base64": ...}."""
+    return {f"{kind}_base64": explanation_b64(explanations, kind) for kind in EXPLANATION_KINDS}
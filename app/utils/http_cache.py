@@ -0,0 +1,50 @@
+import hashlib
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+# content addressed by scan id never changes (original upload, thumbnails)
+IMMUTABLE = "private, max-age=31536000, immutable"
+# may still change (explanations, reports): keep a copy but always revalidate via ETag
+REVALIDATE = "private, no-cache"
+
+
+def strong_etag(digest_hex: str) -> str:
+    return f'"{digest_hex}"'
+
+
+def etag_for_bytes(data: bytes) -> str:
+    return strong_etag(hashlib.sha256(data).hexdigest())
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    return "*" in candidates or etag in (c[2:] if c.startswith("W/") else c for c in candidates)
+
+
+def not_modified_response(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def cached_bytes_response(request: Request, data: bytes, media_type: str,
+                          cache_control: str = REVALIDATE, etag: str | None = None) -> Response:
+    etag = etag or etag_for_bytes(data)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, cache_control)
+    return Response(content=data, media_type=media_type, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def cached_stream_response(request: Request, chunks, media_type: str, etag: str,
+                           cache_control: str = IMMUTABLE, content_length: int | None = None,
+                           headers: dict | None = None) -> Response:
+    """Like cached_bytes_response, for streamed bodies; the ETag must be known up front."""
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, cache_control)
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": cache_control}
+    if content_length is not None:
+        headers["Content-Length"] = str(content_length)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
@@ -0,0 +1,211 @@
+"""
+Shared aiohttp client for the explanation microservices.
+
+One ClientSession per process (created lazily on the running loop), with a
+bounded keep-alive connector so consecutive scans reuse TCP/TLS connections.
+Each downstream service gets a ServiceClient with its own timeouts, bounded
+retries, circuit breaker and latency/error counters.
+"""
+import asyncio
+import time
+
+import aiohttp
+
+from app.utils.stats import LatencyWindow
+
+
+class CircuitOpen(Exception):
+    def __init__(self, service: str, retry_in_s: float):
+        super().__init__(f"{service} circuit open, retry in {retry_in_s:.1f}s")
+        self.retry_in_s = retry_in_s
+
+
+class ServiceError(Exception):
+    """Non-retryable answer (4xx) or retries exhausted."""
+
+
+class MalformedResponse(Exception):
+    """200 answer whose body is not the expected JSON object; retried and counted like a 5xx."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failed calls; while
+    open every call fails immediately. After `reset_timeout_s` one trial call
+    is let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_s:
+            return "half_open"
+        return "open"
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout_s - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """A call ended without telling us anything about the service (e.g. cancelled): let another trial through."""
+        self._trial_in_flight = False
+
+
+class ServiceClient:
+    def __init__(self, pool: "HttpClientPool", name: str, url: str, connect_timeout_s: float = 3.0,
+                 read_timeout_s: float = 60.0, retries: int = 2, backoff_s: float = 0.5,
+                 breaker: CircuitBreaker | None = None, history: int = 512):
+        self.pool = pool
+        self.name = name
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout_s, sock_read=read_timeout_s)
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.breaker = breaker or CircuitBreaker()
+
+        self.calls = 0
+        self.succeeded = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retried = 0
+        self.short_circuited = 0
+        self.last_error: str | None = None
+        self._latencies = LatencyWindow(history)  # ms per successful call, retries included
+
+    async def post_file(self, data: bytes, filename: str = "scan.jpg", content_type: str = "image/jpeg") -> dict:
+        """POST `data` as multipart field `file` and return the JSON body."""
+        self.calls += 1
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise CircuitOpen(self.name, self.breaker.retry_in())
+
+        try:
+            return await self._post_with_retries(data, filename, content_type)
+        except asyncio.CancelledError:
+            self.breaker.release_trial()
+            raise
+        except ServiceError:
+            raise  # already recorded on the breaker
+        except Exception as e:
+            # anything unexpected counts against the service, and never leaves a half-open trial claimed
+            self.errors += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            self.breaker.record_failure()
+            raise
+
+    async def _post_with_retries(self, data: bytes, filename: str, content_type: str) -> dict:
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                # the form is consumed by each send, so it is rebuilt per attempt
+                form = aiohttp.FormData()
+                form.add_field("file", data, filename=filename, content_type=content_type)
+                session = await self.pool.session()
+                async with session.post(self.url, data=form, timeout=self.timeout) as resp:
+                    if resp.status >= 500:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status, message=resp.reason or ""
+                        )
+                    if resp.status != 200:
+                        # the request itself is wrong; the service is fine and retrying won't help
+                        self.breaker.record_success()
+                        self.errors += 1
+                        self.last_error = f"HTTP {resp.status}"
+                        raise ServiceError(f"{self.name} answered {resp.status}")
+                    try:
+                        body = await resp.json()
+                    except ValueError as e:  # invalid JSON
+                        raise MalformedResponse(f"{self.name} answered invalid JSON: {e}") from e
+                    if not isinstance(body, dict):
+                        raise MalformedResponse(f"{self.name} answered {type(body).__name__}, expected an object")
+            except (aiohttp.ClientError, asyncio.TimeoutError, MalformedResponse) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                if attempt < self.retries:
+                    self.retried += 1
+                    await asyncio.sleep(self.backoff_s * 2 ** attempt)
+                    continue
+                self.errors += 1
+                self.breaker.record_failure()
+                raise ServiceError(f"{self.name} failed after {attempt + 1} attempts: {self.last_error}") from e
+            else:
+                self.breaker.record_success()
+                self.succeeded += 1
+                self._latencies.add((time.perf_counter() - start) * 1000)
+                return body
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "circuit": self.breaker.state,
+            "calls": self.calls,
+            "succeeded": self.succeeded,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retried": self.retried,
+            "short_circuited": self.short_circuited,
+            "last_error": self.last_error,
+            **self._latencies.summary("latency_ms"),
+        }
+
+
+class HttpClientPool:
+    def __init__(self, limit: int = 32, limit_per_host: int = 16, keepalive_timeout_s: float = 30.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout_s = keepalive_timeout_s
+        self.services: dict[str, ServiceClient] = {}
+        self._session: aiohttp.ClientSession | None = None
+
+    def service(self, name: str, url: str, **kwargs) -> ServiceClient:
+        self.services[name] = ServiceClient(self, name, url, **kwargs)
+        return self.services[name]
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout_s,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        return {name: client.stats() for name, client in self.services.items()}
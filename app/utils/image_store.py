@@ -0,0 +1,109 @@
+"""
+Scan images live in GridFS (fs_bucket); scan documents only keep `image_file_id`.
+Documents written before the migration still carry inline `image_data`, so
+readers go through load_scan_image()/iter_scan_image(), which handle both.
+"""
+from bson import ObjectId, Binary
+from gridfs.errors import NoFile
+
+from app.database import fs_bucket, scans_collection
+from app.utils.thread_executor import run_in_thread
+from app.utils.thumbnails import THUMBNAIL_SIZES, thumbnails_from_bytes
+
+
+async def store_image(image_bytes: bytes, filename: str, content_type: str, scan_id: ObjectId | None = None) -> ObjectId:
+    return await fs_bucket.upload_from_stream(
+        filename or "scan",
+        image_bytes,
+        metadata={"content_type": content_type, "scan_id": scan_id},
+    )
+
+
+async def iter_image_chunks(file_id: ObjectId):
+    """Yield the stored file chunk by chunk (GridFS chunk size, 255 KB by default)."""
+    grid_out = await fs_bucket.open_download_stream(file_id)
+    while True:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        yield chunk
+
+
+async def read_image(file_id: ObjectId) -> bytes:
+    return b"".join([chunk async for chunk in iter_image_chunks(file_id)])
+
+
+async def delete_image(file_id: ObjectId | None):
+    if file_id is None:
+        return
+    try:
+        await fs_bucket.delete(file_id)
+    except NoFile:
+        pass
+
+
+async def delete_scan_images(query: dict) -> list:
+    """
+    Remove the GridFS files of every scan matching `query` (call before
+    deleting the scans). Returns the ids of those scans.
+    """
+    scan_ids = []
+    async for doc in scans_collection.find(query, {"image_file_id": 1}):
+        await delete_image(doc.get("image_file_id"))
+        scan_ids.append(doc["_id"])
+    return scan_ids
+
+
+def _inline_bytes(raw) -> bytes:
+    return raw if isinstance(raw, (bytes, bytearray)) else raw.value
+
+
+async def load_scan_image(doc: dict) -> bytes | None:
+    if doc.get("image_file_id"):
+        try:
+            return await read_image(doc["image_file_id"])
+        except NoFile:
+            return None
+    raw = doc.get("image_data")
+    return _inline_bytes(raw) if raw else None
+
+
+async def iter_scan_image(doc: dict):
+    if doc.get("image_file_id"):
+        async for chunk in iter_image_chunks(doc["image_file_id"]):
+            yield chunk
+    elif doc.get("image_data"):
+        yield _inline_bytes(doc["image_data"])
+
+
+THUMBNAIL_PROJECTION = {"thumbnails": 1, "image_file_id": 1}
+
+
+async def get_thumbnail(query: dict, size: str) -> bytes | None:
+    """
+    Stored WebP thumbnail of the scan matching `query`. Scans uploaded before
+    thumbnails existed get them generated (and saved) on first request.
+    """
+    doc = await scans_collection.find_one(query, THUMBNAIL_PROJECTION)
+    if not doc:
+        return None
+    thumbs = doc.get("thumbnails") or {}
+    if size in thumbs:
+        return bytes(thumbs[size])
+
+    if not doc.get("image_file_id"):
+        doc = await scans_collection.find_one(query, {"image_data": 1})
+    image_bytes = await load_scan_image(doc)
+    if not image_bytes:
+        return None
+
+    thumbs = await run_in_thread(thumbnails_from_bytes, image_bytes)
+    await scans_collection.update_one(
+        {"_id": doc["_id"]},
+        {"$set": {f"thumbnails.{k}": Binary(v) for k, v in thumbs.items()}}
+    )
+    return thumbs.get(size)
+
+
+def thumbnail_size_key(size: int) -> str | None:
+    return str(size) if size in THUMBNAIL_SIZES else None
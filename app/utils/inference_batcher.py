@@ -0,0 +1,167 @@
+import asyncio
+import time
+from collections import deque
+
+import numpy as np
+
+from app.utils.stats import LatencyWindow
+from app.utils.thread_executor import executor
+
+
+class InferenceBatcher:
+    """
+    Collects preprocessed tensors from concurrent requests and runs them
+    through `predict_fn` together. A batch is flushed as soon as it holds
+    `max_batch_size` rows or `max_wait_ms` has passed since its first row.
+    Up to `max_in_flight` batches run at once (one per inference worker
+    process); while all of them are busy, new rows keep filling the next batch.
+    `predict_fn` may be a coroutine function; a plain one runs on `executor`
+    (the shared thread pool by default).
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int = 16, max_wait_ms: float = 5.0, max_in_flight: int = 1,
+                 history: int = 512, executor=executor):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_in_flight = max(1, int(max_in_flight))
+
+        self._queue: asyncio.Queue | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._worker: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+        self._sizes = deque(maxlen=history)  # rows per batch
+        self._latencies = LatencyWindow(history)  # ms per batch
+        self.total_batches = 0
+        self.total_rows = 0
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._flushes):
+            task.cancel()  # each flush fails its own batch when cancelled
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        # nothing will serve what is still queued; fail it instead of leaving callers waiting
+        stopped = RuntimeError("inference batcher stopped")
+        while self._queue is not None and not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(stopped)
+
+    async def submit(self, tensor: np.ndarray) -> np.ndarray:
+        """Queue a (n, H, W, C) tensor and wait for its (n, num_classes) predictions."""
+        if getattr(tensor, "ndim", 0) < 2 or len(tensor) == 0:
+            raise ValueError(f"expected a non-empty (n, H, W, C) batch, got shape {getattr(tensor, 'shape', None)}")
+        self.start()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((tensor, fut))
+        return await fut
+
+    @staticmethod
+    def _fail(batch, error: BaseException):
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_exception(error)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # wait for a free slot first, so rows keep accumulating while every flush is busy
+            await self._slots.acquire()
+            batch = []
+            try:
+                batch.append(await self._queue.get())
+                rows = len(batch[0][0])
+                deadline = loop.time() + self.max_wait
+
+                while rows < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    try:
+                        if timeout <= 0:
+                            item = self._queue.get_nowait()
+                        else:
+                            item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                        break
+                    batch.append(item)
+                    rows += len(item[0])
+            except asyncio.CancelledError:
+                self._slots.release()
+                self._fail(batch, RuntimeError("inference batcher stopped"))
+                raise
+
+            task = asyncio.create_task(self._flush(batch, rows))
+            self._flushes.add(task)
+            task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task):
+        self._flushes.discard(task)
+        self._slots.release()
+
+    async def _predict(self, stacked: np.ndarray) -> np.ndarray:
+        if asyncio.iscoroutinefunction(self.predict_fn):
+            return await self.predict_fn(stacked)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.predict_fn, stacked)
+
+    async def _flush(self, batch, rows: int):
+        # a request whose rows don't match the first one's shape fails alone, not the whole batch
+        shape = batch[0][0].shape[1:]
+        mismatched = [(t, fut) for t, fut in batch if t.shape[1:] != shape]
+        if mismatched:
+            self._fail(mismatched, ValueError(f"tensor shape does not match the batch's (n, {', '.join(map(str, shape))})"))
+            batch = [(t, fut) for t, fut in batch if t.shape[1:] == shape]
+            rows = sum(len(t) for t, _ in batch)
+
+        start = time.perf_counter()
+        try:
+            tensors = [t for t, _ in batch]
+            stacked = tensors[0] if len(tensors) == 1 else np.concatenate(tensors, axis=0)
+            preds = await self._predict(stacked)
+        except asyncio.CancelledError:
+            self._fail(batch, RuntimeError("inference batcher stopped"))
+            raise
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        self._sizes.append(rows)
+        self._latencies.add(latency_ms)
+        self.total_batches += 1
+        self.total_rows += rows
+
+        offset = 0
+        for tensor, fut in batch:
+            n = len(tensor)
+            if not fut.done():
+                fut.set_result(preds[offset:offset + n])
+            offset += n
+
+    def stats(self) -> dict:
+        sizes = self._sizes
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": len(self._flushes),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "total_batches": self.total_batches,
+            "total_rows": self.total_rows,
+            "last_batch_size": sizes[-1] if sizes else 0,
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            **self._latencies.summary("latency_ms"),
+        }
@@ -0,0 +1,336 @@
+"""
+Small durable job queue.
+
+Jobs are documents keyed by a caller-chosen id (one job per key, so enqueueing
+the same key while it is queued or running is a no-op):
+
+    {_id, status: queued|running|done|failed, payload, attempts, max_attempts,
+     run_at, lease_until, worker, last_error, created_at, updated_at, finished_at}
+
+Workers claim a job by atomically flipping it to `running` with a lease and
+keep extending that lease while the handler runs; a job whose lease ran out
+(worker crashed or was restarted mid-job) becomes claimable again, so work is
+never lost and a slow job is not picked up a second time. MongoJobStore is the real backend,
+MemoryJobStore an in-process stand-in with the same semantics for tests and
+local development.
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.utils.stats import LatencyWindow
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _claimable(now: datetime) -> dict:
+    return {"$or": [
+        {"status": "queued", "run_at": {"$lte": now}},
+        {"status": "running", "lease_until": {"$lt": now}},
+    ]}
+
+
+class MongoJobStore:
+    def __init__(self, collection, retention_s: int = 7 * 86400):
+        self.collection = collection
+        self.retention_s = retention_s
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("run_at", 1)], name="status_run_at")
+        # finished jobs are only kept for inspection for a while
+        await self.collection.create_index("finished_at", expireAfterSeconds=self.retention_s, name="finished_at_ttl")
+
+    async def enqueue(self, key: str, payload: dict, max_attempts: int) -> bool:
+        """Queue `key` unless it is already queued/running. Returns True if a job was (re)queued."""
+        now = datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"_id": key, "status": {"$nin": list(ACTIVE_STATUSES)}},
+                {
+                    "$set": {
+                        "status": "queued", "payload": payload, "attempts": 0, "max_attempts": max_attempts,
+                        "run_at": now, "lease_until": None, "worker": None, "last_error": None,
+                        "updated_at": now, "finished_at": None,
+                    },
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False  # an active job with this key already exists
+        return True
+
+    async def claim(self, worker_id: str, lease_s: float) -> dict | None:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            _claimable(now),
+            {
+                "$set": {"status": "running", "worker": worker_id, "lease_until": now + timedelta(seconds=lease_s),
+                         "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def extend_lease(self, job: dict, lease_s: float) -> bool:
+        """Push the lease of a running job forward; False if this claim no longer holds it."""
+        now = datetime.utcnow()
+        result = await self.collection.update_one(
+            {"_id": job["_id"], "status": "running", "worker": job["worker"], "attempts": job["attempts"]},
+            {"$set": {"lease_until": now + timedelta(seconds=lease_s), "updated_at": now}},
+        )
+        return result.matched_count == 1
+
+    async def _finish(self, job: dict, fields: dict):
+        # guarded on the claim, so a worker whose lease expired cannot overwrite a newer attempt
+        await self.collection.update_one(
+            {"_id": job["_id"], "worker": job["worker"], "attempts": job["attempts"]},
+            {"$set": {**fields, "updated_at": datetime.utcnow()}},
+        )
+
+    async def complete(self, job: dict):
+        await self._finish(job, {"status": "done", "lease_until": None, "finished_at": datetime.utcnow()})
+
+    async def retry(self, job: dict, error: str, delay_s: float):
+        run_at = datetime.utcnow() + timedelta(seconds=delay_s)
+        await self._finish(job, {"status": "queued", "run_at": run_at, "lease_until": None, "last_error": error})
+
+    async def fail(self, job: dict, error: str):
+        await self._finish(job, {"status": "failed", "lease_until": None, "last_error": error,
+                                 "finished_at": datetime.utcnow()})
+
+    async def get(self, key: str) -> dict | None:
+        return await self.collection.find_one({"_id": key})
+
+    async def counts(self) -> dict:
+        counts = {s: 0 for s in JOB_STATUSES}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["n"]
+        return counts
+
+
+class MemoryJobStore:
+    """Same contract as MongoJobStore, kept in a dict (not durable across restarts)."""
+
+    def __init__(self):
+        self.jobs: dict[str, dict] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def enqueue(self, key: str, payload: dict, max_attempts: int) -> bool:
+        existing = self.jobs.get(key)
+        if existing and existing["status"] in ACTIVE_STATUSES:
+            return False
+        now = datetime.utcnow()
+        self.jobs[key] = {
+            "_id": key, "status": "queued", "payload": payload, "attempts": 0, "max_attempts": max_attempts,
+            "run_at": now, "lease_until": None, "worker": None, "last_error": None,
+            "created_at": existing["created_at"] if existing else now, "updated_at": now, "finished_at": None,
+        }
+        return True
+
+    async def claim(self, worker_id: str, lease_s: float) -> dict | None:
+        now = datetime.utcnow()
+        ready = [
+            j for j in self.jobs.values()
+            if (j["status"] == "queued" and j["run_at"] <= now)
+            or (j["status"] == "running" and j["lease_until"] < now)
+        ]
+        if not ready:
+            return None
+        job = min(ready, key=lambda j: j["run_at"])
+        job.update(status="running", worker=worker_id, lease_until=now + timedelta(seconds=lease_s), updated_at=now)
+        job["attempts"] += 1
+        return dict(job)
+
+    async def extend_lease(self, job: dict, lease_s: float) -> bool:
+        current = self.jobs.get(job["_id"])
+        if not (current and current["status"] == "running" and current["worker"] == job["worker"]
+                and current["attempts"] == job["attempts"]):
+            return False
+        now = datetime.utcnow()
+        current.update(lease_until=now + timedelta(seconds=lease_s), updated_at=now)
+        return True
+
+    async def _finish(self, job: dict, fields: dict):
+        current = self.jobs.get(job["_id"])
+        if current and current["worker"] == job["worker"] and current["attempts"] == job["attempts"]:
+            current.update(fields, updated_at=datetime.utcnow())
+
+    async def complete(self, job: dict):
+        await self._finish(job, {"status": "done", "lease_until": None, "finished_at": datetime.utcnow()})
+
+    async def retry(self, job: dict, error: str, delay_s: float):
+        run_at = datetime.utcnow() + timedelta(seconds=delay_s)
+        await self._finish(job, {"status": "queued", "run_at": run_at, "lease_until": None, "last_error": error})
+
+    async def fail(self, job: dict, error: str):
+        await self._finish(job, {"status": "failed", "lease_until": None, "last_error": error,
+                                 "finished_at": datetime.utcnow()})
+
+    async def get(self, key: str) -> dict | None:
+        job = self.jobs.get(key)
+        return dict(job) if job else None
+
+    async def counts(self) -> dict:
+        counts = {s: 0 for s in JOB_STATUSES}
+        for job in self.jobs.values():
+            counts[job["status"]] += 1
+        return counts
+
+
+class JobWorker:
+    """
+    Runs `handler(job)` for claimed jobs with at most `concurrency` in flight.
+    A handler exception retries the job after an exponential backoff
+    (`backoff_base_s * 2**(attempt-1)`, capped at `backoff_max_s`) until the
+    job has used `max_attempts`, then marks it failed. While a handler runs its
+    lease is extended every `lease_s / 3`; if the lease is lost anyway (e.g.
+    the store was unreachable for longer than `lease_s`), the handler is
+    cancelled, since another worker may already be running the job. Idle
+    workers poll every `poll_interval_s`; notify() wakes them immediately
+    after a local enqueue.
+    """
+
+    def __init__(self, store, handler, concurrency: int = 2, poll_interval_s: float = 1.0, lease_s: float = 300.0,
+                 max_attempts: int = 5, backoff_base_s: float = 2.0, backoff_max_s: float = 300.0,
+                 history: int = 512):
+        self.store = store
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval_s = poll_interval_s
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self._tasks: list[asyncio.Task] = []
+        self._wake: asyncio.Event | None = None
+        self._stopping = False
+        self.in_flight = 0
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.leases_lost = 0
+        self._durations = LatencyWindow(history)  # ms per handler run
+
+    async def enqueue(self, key: str, payload: dict) -> bool:
+        queued = await self.store.enqueue(key, payload, self.max_attempts)
+        if queued:
+            self.notify()
+        return queued
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._loop()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        self._stopping = True
+        self.notify()
+        for task in self._tasks:
+            task.cancel()
+        # a cancelled job keeps its lease and is picked up again once it expires
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def backoff(self, attempt: int) -> float:
+        return min(self.backoff_max_s, self.backoff_base_s * 2 ** max(0, attempt - 1))
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                job = await self.store.claim(self.worker_id, self.lease_s)
+            except Exception as e:
+                print(f"[ERROR] Job queue claim failed: {e}")
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval_s)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                print(f"[ERROR] Job queue bookkeeping failed for {job['_id']}: {e}")
+
+    async def _run(self, job: dict):
+        max_attempts = job.get("max_attempts") or self.max_attempts
+        if job["attempts"] > max_attempts:
+            # only reachable when earlier attempts died with the worker
+            await self.store.fail(job, job.get("last_error") or "worker lost the job too many times")
+            self.failed += 1
+            return
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        handler = asyncio.create_task(self.handler(job))
+        lost = asyncio.Event()
+        lease = asyncio.create_task(self._keep_lease(job, handler, lost))
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not lost.is_set():
+                raise  # worker stopping: the job keeps its lease and is picked up again once it expires
+            self.leases_lost += 1
+            print(f"[WARN] Lost the lease on job {job['_id']}; left to the worker that holds it now")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] >= max_attempts:
+                await self.store.fail(job, error)
+                self.failed += 1
+            else:
+                await self.store.retry(job, error, self.backoff(job["attempts"]))
+                self.retried += 1
+        else:
+            await self.store.complete(job)
+            self.succeeded += 1
+        finally:
+            lease.cancel()
+            self.in_flight -= 1
+            self._durations.add((time.perf_counter() - start) * 1000)
+
+    async def _keep_lease(self, job: dict, handler: asyncio.Task, lost: asyncio.Event):
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            try:
+                held = await self.store.extend_lease(job, self.lease_s)
+            except Exception as e:
+                print(f"[ERROR] Could not extend the lease on job {job['_id']}: {e}")
+                continue
+            if not held:
+                lost.set()
+                handler.cancel()
+                return
+
+    async def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "running": bool(self._tasks),
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "failed": self.failed,
+            "leases_lost": self.leases_lost,
+            **self._durations.summary("job_ms"),
+            "jobs": await self.store.counts(),
+        }
@@ -0,0 +1,77 @@
+"""
+Convert legacy base64 explanation strings into recompressed binary
+(see app/utils/explanation_store.py) and report the bytes saved.
+
+    python -m app.utils.migrate_explanations                 # migrate everything
+    python -m app.utils.migrate_explanations --dry-run       # only measure, write nothing
+    python -m app.utils.migrate_explanations --per-scan      # also print one line per scan
+
+Sizes are measured as stored in Mongo: the base64 string length before, the
+binary payload length after. Each update is guarded on the legacy fields
+still being present, so the script is safe to re-run or interrupt.
+"""
+import argparse
+import asyncio
+
+from app.database import scans_collection
+from app.utils.explanation_store import EXPLANATION_KINDS, pack_explanations, explanation_update
+from app.utils.thread_executor import run_in_thread
+
+LEGACY_FIELDS = [f"explanations.{kind}_base64" for kind in EXPLANATION_KINDS]
+
+
+async def migrate(dry_run: bool = False, per_scan: bool = False, batch_size: int = 50) -> dict:
+    query = {"$or": [{field: {"$type": "string"}} for field in LEGACY_FIELDS]}
+    total = await scans_collection.count_documents(query)
+    print(f"[INFO] {total} scans with base64 explanations")
+
+    scanned = migrated = bytes_before = bytes_after = 0
+    cursor = scans_collection.find(query, {"_id": 1}).batch_size(batch_size)
+    async for ref in cursor:
+        doc = await scans_collection.find_one({"_id": ref["_id"]}, {field: 1 for field in LEGACY_FIELDS})
+        if not doc:
+            continue
+        legacy = {kind: (doc.get("explanations") or {}).get(f"{kind}_base64") for kind in EXPLANATION_KINDS}
+        try:
+            packed = await run_in_thread(pack_explanations, legacy)
+        except Exception as e:
+            print(f"[WARN] {doc['_id']}: could not decode explanations ({e}), skipped")
+            continue
+
+        before = sum(len(v) for v in legacy.values() if v)
+        after = sum(len(p["data"]) for p in packed.values() if p)
+        scanned += 1
+        bytes_before += before
+        bytes_after += after
+        if per_scan:
+            print(f"{doc['_id']}\t{before}\t{after}\t{before - after}")
+
+        if dry_run:
+            continue
+        result = await scans_collection.update_one(
+            {"_id": doc["_id"], **{f"explanations.{kind}_base64": {"$type": "string"} for kind, v in legacy.items() if v}},
+            explanation_update(packed),
+        )
+        migrated += result.modified_count
+        if migrated and migrated % 100 == 0:
+            print(f"[INFO] migrated {migrated}/{total}")
+
+    saved = bytes_before - bytes_after
+    avg = saved / scanned if scanned else 0
+    print(f"[INFO] {'would save' if dry_run else 'saved'} {saved / 1e6:.1f} MB over {scanned} scans "
+          f"({bytes_before / 1e6:.1f} MB -> {bytes_after / 1e6:.1f} MB, {avg / 1e3:.1f} KB per scan)")
+    return {
+        "pending": total - migrated,
+        "migrated": migrated,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved_per_scan": round(avg),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store scan explanations as recompressed binary.")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--per-scan", action="store_true", help="print scan_id, bytes before, after, saved")
+    args = parser.parse_args()
+    asyncio.run(migrate(dry_run=args.dry_run, per_scan=args.per_scan))
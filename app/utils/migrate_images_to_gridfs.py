@@ -0,0 +1,60 @@
+"""
+Move inline `image_data` blobs from existing scan documents into GridFS.
+
+    python -m app.utils.migrate_images_to_gridfs            # migrate everything
+    python -m app.utils.migrate_images_to_gridfs --dry-run  # only count
+
+Each scan is handled independently: the image is uploaded first, then the
+document is switched to `image_file_id` in a single update guarded on the
+blob still being present, so the script is safe to re-run or interrupt.
+"""
+import argparse
+import asyncio
+
+from app.database import scans_collection
+from app.utils.image_store import store_image, delete_image
+
+
+async def migrate(dry_run: bool = False, batch_size: int = 50) -> dict:
+    query = {"image_data": {"$exists": True}, "image_file_id": {"$exists": False}}
+    total = await scans_collection.count_documents(query)
+    print(f"[INFO] {total} scans with inline images")
+    if dry_run or total == 0:
+        return {"pending": total, "migrated": 0, "bytes_moved": 0}
+
+    migrated = bytes_moved = 0
+    # only ids in the cursor; each blob is fetched on its own to keep memory flat
+    cursor = scans_collection.find(query, {"_id": 1}).batch_size(batch_size)
+    async for ref in cursor:
+        doc = await scans_collection.find_one(
+            {"_id": ref["_id"], "image_data": {"$exists": True}},
+            {"image_data": 1, "image_filename": 1, "image_content_type": 1},
+        )
+        if not doc:
+            continue
+        raw = doc["image_data"]
+        image_bytes = raw if isinstance(raw, (bytes, bytearray)) else raw.value
+
+        file_id = await store_image(image_bytes, doc.get("image_filename"), doc.get("image_content_type"), doc["_id"])
+        result = await scans_collection.update_one(
+            {"_id": doc["_id"], "image_data": {"$exists": True}},
+            {"$set": {"image_file_id": file_id, "image_size": len(image_bytes)}, "$unset": {"image_data": ""}},
+        )
+        if result.modified_count:
+            migrated += 1
+            bytes_moved += len(image_bytes)
+        else:
+            await delete_image(file_id)  # someone else migrated it concurrently
+
+        if migrated and migrated % 100 == 0:
+            print(f"[INFO] migrated {migrated}/{total} ({bytes_moved / 1e6:.1f} MB)")
+
+    print(f"[INFO] done: migrated {migrated} scans, moved {bytes_moved / 1e6:.1f} MB to GridFS")
+    return {"pending": total - migrated, "migrated": migrated, "bytes_moved": bytes_moved}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move inline scan images into GridFS.")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(migrate(dry_run=args.dry_run))
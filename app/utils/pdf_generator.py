@@ -1,15 +1,81 @@
+import io
 import os
 import base64
+import hashlib
 import re
-import uuid
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from PIL import Image
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
 from reportlab.lib import colors
 
-def generate_pdf_report(user: dict, scan: dict, pdf_path: str):
-    c = canvas.Canvas(pdf_path, pagesize=A4)
+# image resolution and JPEG quality are passed in by app.reports (REPORT_IMAGE_DPI / REPORT_IMAGE_QUALITY)
+REPORT_IMAGE_CACHE_ENTRIES = int(os.getenv("REPORT_IMAGE_CACHE_ENTRIES", "256"))
+
+# resampled images by (content hash, box, dpi, quality): the same scan re-rendered
+# (new explanations, another user, cache eviction) skips the decode + resize
+_resampled: OrderedDict[tuple, bytes] = OrderedDict()
+_resampled_lock = threading.Lock()
+
+
+def render_pdf_report(user: dict, scan: dict, *, image_dpi: int, image_quality: int) -> bytes:
+    """Build the report in memory and return the PDF bytes (images resampled to `image_dpi`, 0 = embed originals)."""
+    buf = io.BytesIO()
+    generate_pdf_report(user, scan, buf, image_dpi=image_dpi, image_quality=image_quality)
+    return buf.getvalue()
+
+
+def resample_for_box(data: bytes, w: float, h: float, dpi: int, quality: int) -> bytes:
+    """
+    JPEG no larger than a `w` x `h` point box needs at `dpi` (72 points per
+    inch). Images already that small are only re-encoded if that shrinks them.
+    """
+    key = (hashlib.sha1(data).digest(), w, h, dpi, quality)
+    with _resampled_lock:
+        cached = _resampled.get(key)
+        if cached is not None:
+            _resampled.move_to_end(key)
+            return cached
+
+    max_px = (max(1, round(w / 72 * dpi)), max(1, round(h / 72 * dpi)))
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG":
+        img.draft("RGB", max_px)  # decode at reduced scale straight away
+    if img.mode in ("RGBA", "LA", "P"):
+        # JPEG has no alpha: flatten onto the white page
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail(max_px, Image.LANCZOS)
+
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    out = buf.getvalue() if buf.tell() < len(data) else data
+
+    with _resampled_lock:
+        _resampled[key] = out
+        while len(_resampled) > REPORT_IMAGE_CACHE_ENTRIES:
+            _resampled.popitem(last=False)
+    return out
+
+
+def _scan_image(scan: dict):
+    return scan.get("image_bytes") or scan.get("image_base64")
+
+
+def _explanation_image(scan: dict, kind: str):
+    # raw bytes from explanation_store when available, base64 otherwise
+    return (scan.get("explanation_images") or {}).get(kind) or (scan.get("explanations") or {}).get(f"{kind}_base64")
+
+
+def generate_pdf_report(user: dict, scan: dict, pdf_path, *, image_dpi: int, image_quality: int):
+    """Write the report to `pdf_path`, a file path or a binary file object."""
+    c = canvas.Canvas(pdf_path, pagesize=A4, pageCompression=1)
+    img_opts = {"dpi": image_dpi, "quality": image_quality}
     width, height = A4
     margin = 40
     y = height - margin
@@ -22,7 +88,10 @@ def generate_pdf_report(user: dict, scan: dict, pdf_path: str):
     y -= 14
     c.setFont("Helvetica", 9)
     c.setFillColor(colors.grey)
-    c.drawCentredString(width / 2, y, "A product of Lumenary Inc. | Generated: " + datetime.now().strftime('%d %b %Y'))
+    # the scan date rather than a render date: reports are cached and served again later
+    uploaded = scan.get("uploaded_at")
+    scan_date = f" | Scan date: {uploaded.strftime('%d %b %Y')}" if hasattr(uploaded, "strftime") else ""
+    c.drawCentredString(width / 2, y, "A product of Lumenary Inc." + scan_date)
 
     # Separator
     y -= 10
@@ -71,20 +140,20 @@ def generate_pdf_report(user: dict, scan: dict, pdf_path: str):
     c.setFillColor(colors.HexColor("#264653"))
     c.drawString(margin, y, "Scan Image")
     y -= 130
-    draw_image_from_base64(scan.get("image_base64"), c, x=margin, y=y, w=160, h=120)
+    draw_image(_scan_image(scan), c, x=margin, y=y, w=160, h=120, **img_opts)
 
     # --- Explanation Table ---
     c.setFont("Helvetica-Bold", 11)
     c.drawString(margin + 180, y + 130, "Model Explanations")
     y -= 10
 
-    shap_b64 = scan.get("explanations", {}).get("shap_base64")
-    occ_b64 = scan.get("explanations", {}).get("occlusion_base64")
+    shap_img = _explanation_image(scan, "shap")
+    occ_img = _explanation_image(scan, "occlusion")
 
-    if shap_b64 or occ_b64:
+    if shap_img or occ_img:
         y -= 130
-        draw_image_from_base64(shap_b64, c, x=margin + 180, y=y + 130, w=130, h=110)
-        draw_image_from_base64(occ_b64, c, x=margin + 330, y=y + 130, w=130, h=110)
+        draw_image(shap_img, c, x=margin + 180, y=y + 130, w=130, h=110, **img_opts)
+        draw_image(occ_img, c, x=margin + 330, y=y + 130, w=130, h=110, **img_opts)
         c.setFont("Helvetica", 8)
         c.drawCentredString(margin + 245, y + 10, "SHAP Explanation")
         c.drawCentredString(margin + 395, y + 10, "Occlusion Map")
@@ -109,20 +178,25 @@ def generate_pdf_report(user: dict, scan: dict, pdf_path: str):
     c.save()
 
 
+def _decode_b64(b64_str: str) -> bytes:
+    img_data = re.sub(r"^data:image\/[a-zA-Z]+;base64,", "", b64_str)
+    img_data += "=" * (-len(img_data) % 4)
+    return base64.b64decode(img_data)
+
+
 def draw_image_from_base64(b64_str, c: canvas.Canvas, x: int, y: int, w: int, h: int):
-    try:
-        if not b64_str:
-            return
-        img_data = re.sub(r"^data:image\/[a-zA-Z]+;base64,", "", b64_str)
-        img_data += "=" * (-len(img_data) % 4)
+    draw_image(b64_str, c, x, y, w, h, dpi=0, quality=0)
 
-        os.makedirs("temp_uploads", exist_ok=True)
-        temp_path = f"temp_uploads/temp_img_{uuid.uuid4().hex}.jpg"
-        with open(temp_path, "wb") as f:
-            f.write(base64.b64decode(img_data))
 
-        c.drawImage(ImageReader(temp_path), x, y, width=w, height=h, preserveAspectRatio=True)
-        os.remove(temp_path)
+def draw_image(img, c: canvas.Canvas, x: int, y: int, w: int, h: int, *, dpi: int, quality: int):
+    """Draw raw image bytes (or a base64 string) straight from memory, resampled for the box unless dpi is 0."""
+    try:
+        if not img:
+            return
+        data = _decode_b64(img) if isinstance(img, str) else bytes(img)
+        if dpi:
+            data = resample_for_box(data, w, h, dpi, quality)
+        c.drawImage(ImageReader(io.BytesIO(data)), x, y, width=w, height=h, preserveAspectRatio=True)
     except Exception as e:
         c.setFont("Helvetica", 8)
         c.setFillColor(colors.red)
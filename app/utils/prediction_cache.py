@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "2048"))
+PREDICTION_CACHE_TTL_SECONDS = int(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "86400"))
+PREDICTION_CACHE_PERSIST = os.getenv("PREDICTION_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+
+
+def image_digest(image_bytes: bytes) -> str:
+    """sha256 of an upload; hashing megabytes takes a while, so call it through run_in_thread."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def content_key(digest: str, model_version: str | None, variant: str = "") -> str | None:
+    """
+    Cache key of an upload (by its image_digest()) under one model version and
+    inference `variant` (backend, quantization, TTA settings). None while no
+    model version is active, so results are never cached under a version-less key.
+    """
+    if not model_version:
+        return None
+    return hashlib.sha256(f"{digest}|{model_version}|{variant}".encode()).hexdigest()
+
+
+class PredictionCache:
+    """
+    Results for an uploaded image keyed by content_key(). Entries hold any of
+    "prediction" ([label, confidence]), "shap" and "occlusion" (packed explanations, see explanation_store).
+
+    Tier 1 is a bounded in-process LRU with TTL; tier 2 (optional) is a Mongo
+    collection whose documents expire through a TTL index.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, collection=None):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.collection = collection
+
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.persistent_hits = 0
+
+    async def ensure_indexes(self):
+        if self.collection is not None:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _get_local(self, key: str) -> dict | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _put_local(self, key: str, fields: dict):
+        with self._lock:
+            _, current = self._entries.pop(key, (None, {}))
+            self._entries[key] = (time.monotonic() + self.ttl, {**current, **fields})
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def get(self, key: str) -> dict | None:
+        value = self._get_local(key)
+        if value is None and self.collection is not None:
+            doc = await self.collection.find_one({"_id": key})
+            if doc:
+                value = {k: v for k, v in doc.items() if k not in ("_id", "expires_at")}
+                self._put_local(key, value)
+                self.persistent_hits += 1
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def update(self, key: str, **fields):
+        self._put_local(key, fields)
+        if self.collection is not None:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {**fields, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)}},
+                upsert=True,
+            )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "persistent": self.collection is not None,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _persistent_collection():
+    if not PREDICTION_CACHE_PERSIST:
+        return None
+    from app.database import db
+    return db["prediction_cache"]
+
+
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_MAX_ENTRIES,
+    ttl_seconds=PREDICTION_CACHE_TTL_SECONDS,
+    collection=_persistent_collection(),
+)
@@ -0,0 +1,283 @@
+"""
+Inference worker processes.
+
+Each worker is a separate (spawned) process that loads the model once and
+serves requests over a Pipe. Only tiny control messages go through the pipe;
+image bytes, input tensors and output probabilities are exchanged through
+per-worker multiprocessing.shared_memory blocks, so nothing large is pickled.
+A worker that dies is restarted transparently on the next call.
+"""
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+import numpy as np
+
+from app.model_registry import file_version
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+def _worker_main(conn, model_path, in_name, out_name, bytes_name, input_shape, num_classes, max_batch_size):
+    # Runs in the child: import the heavy stack here, never in the parent's pickled args.
+    from app.ml_model import registry, predict_local, preprocess_image_bytes, preprocess_with_thumbnails
+
+    in_shm, out_shm, bytes_shm = SharedMemory(in_name), SharedMemory(out_name), SharedMemory(bytes_name)
+    inputs = np.ndarray((max_batch_size, *input_shape), dtype=np.float32, buffer=in_shm.buf)
+    outputs = np.ndarray((max_batch_size, num_classes), dtype=np.float32, buffer=out_shm.buf)
+
+    registry.swap(model_path)
+    conn.send(("ready", registry.version))
+
+    try:
+        while True:
+            msg = conn.recv()
+            kind = msg[0]
+            try:
+                if kind == "predict":
+                    n = msg[1]
+                    outputs[:n] = predict_local(inputs[:n])
+                    conn.send(("ok", n))
+                elif kind == "preprocess":
+                    tensor = preprocess_image_bytes(bytes(bytes_shm.buf[:msg[1]]))
+                    if tensor is None:
+                        conn.send(("invalid", 0))
+                    else:
+                        inputs[0] = tensor[0]
+                        conn.send(("ok", 1))
+                elif kind == "preprocess_thumbnails":
+                    # one decode for both; the WebP thumbnails go back through the (now consumed) bytes block
+                    tensor, thumbs = preprocess_with_thumbnails(bytes(bytes_shm.buf[:msg[1]]))
+                    if tensor is None:
+                        conn.send(("invalid", []))
+                    else:
+                        inputs[0] = tensor[0]
+                        layout, offset = [], 0
+                        for size, data in thumbs.items():
+                            bytes_shm.buf[offset:offset + len(data)] = data
+                            layout.append((size, len(data)))
+                            offset += len(data)
+                        conn.send(("ok", layout))
+                elif kind == "reload":
+                    conn.send(("ok", registry.swap(msg[1])))
+                elif kind == "stop":
+                    break
+            except Exception as e:
+                conn.send(("error", repr(e)))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del inputs, outputs
+        in_shm.close()
+        out_shm.close()
+        bytes_shm.close()
+
+
+class _Worker:
+    def __init__(self, ctx, index: int, pool: "InferencePool"):
+        self.ctx = ctx
+        self.index = index
+        self.pool = pool
+
+        float_size = np.dtype(np.float32).itemsize
+        self.in_shm = SharedMemory(create=True, size=pool.max_batch_size * int(np.prod(pool.input_shape)) * float_size)
+        self.out_shm = SharedMemory(create=True, size=pool.max_batch_size * pool.num_classes * float_size)
+        self.bytes_shm = SharedMemory(create=True, size=pool.max_image_bytes)
+        self.inputs = np.ndarray((pool.max_batch_size, *pool.input_shape), dtype=np.float32, buffer=self.in_shm.buf)
+        self.outputs = np.ndarray((pool.max_batch_size, pool.num_classes), dtype=np.float32, buffer=self.out_shm.buf)
+
+        self.process = None
+        self.conn = None
+        self.model_path = None
+        self.restarts = 0
+
+    def start(self):
+        self.model_path = self.pool.model_path
+        parent_conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(
+            target=_worker_main,
+            args=(child_conn, str(self.pool.model_path), self.in_shm.name, self.out_shm.name,
+                  self.bytes_shm.name, self.pool.input_shape, self.pool.num_classes, self.pool.max_batch_size),
+            name=f"inference-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        status, version = self.conn.recv()  # blocks until the model is loaded
+        print(f"[INFO] Inference worker {self.index} (pid {self.process.pid}) ready with model {version}")
+
+    def restart(self):
+        self.restarts += 1
+        print(f"[WARN] Restarting inference worker {self.index} (restart #{self.restarts})")
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+        if self.process is not None:
+            self.process.join(timeout=5)
+        self.start()
+
+    def call(self, msg):
+        if not self.process.is_alive():
+            self.restart()
+        try:
+            self.conn.send(msg)
+            status, payload = self.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError) as e:
+            self.restart()
+            raise WorkerCrashed(f"inference worker {self.index} died: {e!r}")
+        if status == "error":
+            raise RuntimeError(payload)
+        return status, payload
+
+    def stop(self):
+        try:
+            self.conn.send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        del self.inputs, self.outputs
+        for shm in (self.in_shm, self.out_shm, self.bytes_shm):
+            shm.close()
+            shm.unlink()
+
+
+class InferencePool:
+    def __init__(self, num_workers: int, model_path, input_shape, num_classes: int,
+                 max_batch_size: int = 16, max_image_bytes: int = 16 * 1024 * 1024):
+        self.num_workers = num_workers
+        self.model_path = model_path
+        self.input_shape = tuple(input_shape)
+        self.num_classes = num_classes
+        self.max_batch_size = max_batch_size
+        self.max_image_bytes = max_image_bytes
+
+        self.version = file_version(Path(model_path))  # same content hash the workers' registries use
+
+        ctx = get_context("spawn")  # never fork a process that already holds TF state
+        self._workers = [_Worker(ctx, i, self) for i in range(num_workers)]
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._reload_lock = threading.Lock()
+        # one thread per worker process drives its pipe, so chunks of a batch run in parallel
+        self._dispatch = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="inference-dispatch")
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+            self._idle.put(worker)
+
+    def _run(self, fn, retries: int = 1):
+        worker = self._idle.get()
+        try:
+            if worker.model_path != self.model_path:
+                worker.call(("reload", str(self.model_path)))
+                worker.model_path = self.model_path
+            for attempt in range(retries + 1):
+                try:
+                    return fn(worker)
+                except WorkerCrashed:
+                    if attempt == retries:
+                        raise
+        finally:
+            self._idle.put(worker)
+
+    def _chunk_jobs(self, img_tensor: np.ndarray) -> list:
+        jobs = []
+        for start in range(0, len(img_tensor), self.max_batch_size):
+            chunk = img_tensor[start:start + self.max_batch_size]
+
+            def run(worker, chunk=chunk):
+                n = len(chunk)
+                worker.inputs[:n] = chunk
+                worker.call(("predict", n))
+                return worker.outputs[:n].copy()
+
+            jobs.append(run)
+        return jobs
+
+    def predict(self, img_tensor: np.ndarray) -> np.ndarray:
+        results = list(self._dispatch.map(self._run, self._chunk_jobs(img_tensor)))
+        return results[0] if len(results) == 1 else np.concatenate(results, axis=0)
+
+    async def predict_async(self, img_tensor: np.ndarray) -> np.ndarray:
+        """predict() for the event loop: every chunk goes to its own worker, all at once."""
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._dispatch, self._run, job) for job in self._chunk_jobs(img_tensor)
+        ))
+        return results[0] if len(results) == 1 else np.concatenate(results, axis=0)
+
+    def preprocess(self, image_bytes: bytes):
+        if len(image_bytes) > self.max_image_bytes:
+            raise ValueError(f"image is larger than {self.max_image_bytes} bytes")
+
+        def run(worker):
+            worker.bytes_shm.buf[:len(image_bytes)] = image_bytes
+            status, _ = worker.call(("preprocess", len(image_bytes)))
+            return None if status == "invalid" else worker.inputs[:1].copy()
+
+        return self._run(run)
+
+    def preprocess_with_thumbnails(self, image_bytes: bytes):
+        """(tensor, thumbnails) from a single decode in a worker; (None, {}) for unreadable images."""
+        if len(image_bytes) > self.max_image_bytes:
+            raise ValueError(f"image is larger than {self.max_image_bytes} bytes")
+
+        def run(worker):
+            worker.bytes_shm.buf[:len(image_bytes)] = image_bytes
+            status, layout = worker.call(("preprocess_thumbnails", len(image_bytes)))
+            if status == "invalid":
+                return None, {}
+            thumbs, offset = {}, 0
+            for size, length in layout:
+                thumbs[size] = bytes(worker.bytes_shm.buf[offset:offset + length])
+                offset += length
+            return worker.inputs[:1].copy(), thumbs
+
+        return self._run(run)
+
+    def reload(self, model_path) -> str:
+        """
+        Swap the model in every worker and return its version. Idle workers are
+        reloaded now; busy ones pick up the new path before their next job, so
+        the pool keeps serving.
+        """
+        version = file_version(Path(model_path))
+        with self._reload_lock:
+            self.model_path = model_path
+            self.version = version
+            idle = []
+            try:
+                while True:
+                    idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                for worker in idle:
+                    worker.call(("reload", str(model_path)))
+                    worker.model_path = model_path
+            finally:
+                for worker in idle:
+                    self._idle.put(worker)
+        return version
+
+    def shutdown(self):
+        self._dispatch.shutdown(wait=True)
+        for worker in self._workers:
+            worker.stop()
+
+    def stats(self) -> dict:
+        return {
+            "model_version": self.version,
+            "workers": self.num_workers,
+            "idle": self._idle.qsize(),
+            "alive": sum(1 for w in self._workers if w.process is not None and w.process.is_alive()),
+            "restarts": sum(w.restarts for w in self._workers),
+        }
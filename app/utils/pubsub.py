@@ -0,0 +1,140 @@
+import asyncio
+import os
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "memory": events stay in this process; "mongo": fanned out to every process through a capped collection
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory").lower()
+PUBSUB_QUEUE_SIZE = int(os.getenv("PUBSUB_QUEUE_SIZE", "16"))
+PUBSUB_CAPPED_BYTES = int(os.getenv("PUBSUB_CAPPED_BYTES", str(16 * 1024 * 1024)))
+
+
+class InProcessPubSub:
+    """
+    Channel-based fan-out to asyncio queues. A subscriber that falls behind
+    loses its oldest messages rather than blocking publishers.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def start(self, listen: bool = True):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, channel: str, message: dict):
+        self.published += 1
+        self._deliver(channel, message)
+
+    def _deliver(self, channel: str, message: dict):
+        for queue in self._subscribers.get(channel, ()):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+            self.delivered += 1
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[channel].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers[channel].discard(queue)
+            if not self._subscribers[channel]:
+                del self._subscribers[channel]
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "channels": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+class MongoPubSub(InProcessPubSub):
+    """
+    Same interface, shared across API workers and explanation worker
+    processes: publish() appends to a capped collection and each process
+    tails it once, handing events to its local subscribers.
+    """
+
+    def __init__(self, collection, queue_size: int = 16, capped_bytes: int = 16 * 1024 * 1024):
+        super().__init__(queue_size)
+        self.collection = collection
+        self.capped_bytes = capped_bytes
+        self._listener: asyncio.Task | None = None
+
+    async def start(self, listen: bool = True):
+        from pymongo.errors import CollectionInvalid
+        try:
+            await self.collection.database.create_collection(self.collection.name, capped=True, size=self.capped_bytes)
+        except CollectionInvalid:
+            pass  # already there
+        if listen and self._listener is None:
+            from bson import ObjectId
+            self._listener = asyncio.create_task(self._listen(ObjectId()))
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def publish(self, channel: str, message: dict):
+        self.published += 1
+        await self.collection.insert_one({"channel": channel, "message": message, "ts": datetime.utcnow()})
+
+    async def _listen(self, last_id):
+        from bson import ObjectId
+        from pymongo import CursorType
+        # Tail by _id. ObjectIds of different processes are not ordered within one second,
+        # so a reopened cursor starts at the beginning of the last delivered event's second
+        # and skips the events of that second it has already delivered.
+        seen = set()
+        while True:
+            try:
+                floor = ObjectId.from_datetime(last_id.generation_time)
+                cursor = self.collection.find({"_id": {"$gte": floor}}, cursor_type=CursorType.TAILABLE_AWAIT)
+                async for doc in cursor:
+                    if doc["_id"] in seen:
+                        continue
+                    if doc["_id"].generation_time > last_id.generation_time:
+                        seen.clear()
+                        last_id = doc["_id"]
+                    seen.add(doc["_id"])
+                    self._deliver(doc["channel"], doc["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ERROR] Event listener: {e}")
+            # a tailable cursor dies when the collection is empty or rolls over; reopen it
+            await asyncio.sleep(0.5)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "mongo", "listening": self._listener is not None}
+
+
+def _make_events():
+    if PUBSUB_BACKEND == "mongo":
+        from app.database import db
+        return MongoPubSub(db["events"], PUBSUB_QUEUE_SIZE, PUBSUB_CAPPED_BYTES)
+    return InProcessPubSub(PUBSUB_QUEUE_SIZE)
+
+
+events = _make_events()
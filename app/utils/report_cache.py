@@ -0,0 +1,189 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from app.utils.stats import LatencyWindow
+from app.utils.thread_executor import run_in_thread
+
+load_dotenv()
+
+REPORT_CACHE_MAX_MB = float(os.getenv("REPORT_CACHE_MAX_MB", "64"))
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "")  # empty: no disk tier
+REPORT_CACHE_DISK_MAX_MB = float(os.getenv("REPORT_CACHE_DISK_MAX_MB", "512"))
+
+
+class ReportCache:
+    """
+    Rendered reports keyed by "<scan_id>-<version>". Tier 1 is an in-process
+    LRU bounded by total bytes; tier 2 (optional) is a directory of PDF files,
+    also size-bounded (oldest files go first). Storing a new version of a
+    scan's report drops the older ones, and concurrent misses for the same
+    key share a single render.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: str | None = None, disk_max_bytes: int = 0, history: int = 512):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._render_ms = LatencyWindow(history)
+
+    @staticmethod
+    def _scan_of(key: str) -> str:
+        return key.split("-", 1)[0]
+
+    # --- memory tier ---
+    def _get_local(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def _put_local(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        scan_id = self._scan_of(key)
+        with self._lock:
+            for old in [k for k in self._entries if self._scan_of(k) == scan_id and k != key]:
+                self._bytes -= len(self._entries.pop(old))
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    # --- disk tier (blocking; called through run_in_thread) ---
+    def _read_disk(self, key: str) -> bytes | None:
+        path = self.disk_dir / f"{key}.pdf"
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # keep recently served files from being trimmed first
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        for old in self.disk_dir.glob(f"{self._scan_of(key)}-*.pdf"):
+            if old.stem != key:
+                old.unlink(missing_ok=True)
+        tmp = self.disk_dir / f"{key}.pdf.tmp"
+        tmp.write_bytes(data)
+        tmp.replace(self.disk_dir / f"{key}.pdf")
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = sorted(self.disk_dir.glob("*.pdf"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        for path in files:
+            if total <= self.disk_max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+    def _delete_disk(self, scan_ids: set[str]):
+        for path in self.disk_dir.glob("*.pdf"):
+            if self._scan_of(path.stem) in scan_ids:
+                path.unlink(missing_ok=True)
+
+    # --- public API ---
+    async def get(self, key: str) -> bytes | None:
+        data = self._get_local(key)
+        if data is not None:
+            self.hits += 1
+            return data
+        if self.disk_dir is not None:
+            data = await run_in_thread(self._read_disk, key)
+            if data is not None:
+                self.disk_hits += 1
+                self._put_local(key, data)
+                return data
+        return None
+
+    async def put(self, key: str, data: bytes):
+        self._put_local(key, data)
+        if self.disk_dir is not None:
+            await run_in_thread(self._write_disk, key, data)
+
+    async def get_or_render(self, key: str, render) -> bytes:
+        """Cached bytes for `key`, or the result of `await render()` (stored afterwards)."""
+        data = await self.get(key)
+        if data is not None:
+            return data
+        task = self._inflight.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # the render runs as its own task, so a cancelled caller never cancels it for the others
+            task = asyncio.create_task(self._render(key, render))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._render_done(key, t))
+        return await asyncio.shield(task)
+
+    async def _render(self, key: str, render) -> bytes:
+        start = time.perf_counter()
+        data = await render()
+        self._render_ms.add((time.perf_counter() - start) * 1000)
+        await self.put(key, data)
+        return data
+
+    def _render_done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every caller went away; callers re-raise it themselves
+
+    async def invalidate(self, scan_id: str):
+        await self.invalidate_many([scan_id])
+
+    async def invalidate_many(self, scan_ids):
+        """Drop every cached report of these scans from both tiers (e.g. when the scans are deleted)."""
+        scan_ids = {str(scan_id) for scan_id in scan_ids}
+        if not scan_ids:
+            return
+        with self._lock:
+            for key in [k for k in self._entries if self._scan_of(k) in scan_ids]:
+                self._bytes -= len(self._entries.pop(key))
+        if self.disk_dir is not None:
+            await run_in_thread(self._delete_disk, scan_ids)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_dir": str(self.disk_dir) if self.disk_dir else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            **self._render_ms.summary("render_ms"),
+        }
+
+
+report_cache = ReportCache(
+    max_bytes=int(REPORT_CACHE_MAX_MB * 1024 * 1024),
+    disk_dir=REPORT_CACHE_DIR or None,
+    disk_max_bytes=int(REPORT_CACHE_DISK_MAX_MB * 1024 * 1024),
+)
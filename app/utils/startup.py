@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupTracker:
+    """Wall-clock timings of startup phases plus the readiness flag served at /api/ready."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.ready = False
+        self.ready_after_s: float | None = None
+        self.error: str | None = None
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def mark(self, name: str):
+        """Record the time elapsed since process start under `name`."""
+        self.phases[name] = round((time.perf_counter() - self.started) * 1000, 1)
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_after_s = round(time.perf_counter() - self.started, 2)
+        timings = ", ".join(f"{k}={v}ms" for k, v in self.phases.items())
+        print(f"[INFO] Inference ready after {self.ready_after_s}s ({timings})")
+
+    def mark_failed(self, error: Exception):
+        self.error = repr(error)
+        print(f"[ERROR] Startup failed: {self.error}")
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_after_s": self.ready_after_s,
+            "phases_ms": self.phases,
+            "error": self.error,
+        }
+
+
+startup = StartupTracker()
@@ -0,0 +1,24 @@
+from collections import deque
+
+
+class LatencyWindow:
+    """The last `size` timings (ms), with the percentiles reported by the /stats endpoints."""
+
+    def __init__(self, size: int = 512):
+        self._samples = deque(maxlen=size)
+
+    def add(self, ms: float):
+        self._samples.append(ms)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> float:
+        samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2)
+
+    def summary(self, prefix: str) -> dict:
+        """{"<prefix>_p50": ..., "<prefix>_p99": ...}"""
+        return {f"{prefix}_p50": self.percentile(0.50), f"{prefix}_p99": self.percentile(0.99)}
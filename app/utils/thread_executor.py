@@ -1,9 +1,20 @@
 import asyncio
+import os
 from concurrent.futures import ThreadPoolExecutor
 
-# Global thread pool
-executor = ThreadPoolExecutor(max_workers=3)
+# Global thread pool (size it >= INFERENCE_WORKERS so every worker process can be kept busy)
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("THREAD_POOL_WORKERS", "3")))
+
+# Local explainers (occlusion, SHAP) take seconds per scan; they get their own
+# threads so they never hold up uploads, thumbnails or report rendering
+explain_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EXPLAIN_LOCAL_THREADS", "1")), thread_name_prefix="explain"
+)
 
 async def run_in_thread(func, *args):
     loop = asyncio.get_event_loop()
     return await loop.run_in_executor(executor, func, *args)
+
+async def run_in_explain_thread(func, *args):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(explain_executor, func, *args)
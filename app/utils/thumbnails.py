@@ -0,0 +1,39 @@
+import io
+import os
+
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# longest edge in px for each stored thumbnail
+THUMBNAIL_SIZES = tuple(sorted(int(n) for n in os.getenv("THUMBNAIL_SIZES", "128,384").split(",") if n.strip()))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+
+
+def make_thumbnails(img: Image.Image, sizes=THUMBNAIL_SIZES, quality: int = THUMBNAIL_QUALITY) -> dict[str, bytes]:
+    """WebP thumbnails of an already-decoded RGB image, keyed by size ("128", "384", ...)."""
+    thumbs = {}
+    # phone photos are stored sideways with an EXIF orientation tag; previews are shown upright
+    current = ImageOps.exif_transpose(img)
+    for size in sorted(sizes, reverse=True):
+        # shrink from the previous (larger) thumbnail rather than the original each time;
+        # copy so the caller's image is left untouched (exif_transpose may return it as is)
+        current = current.copy()
+        current.thumbnail((size, size), Image.LANCZOS)
+        buf = io.BytesIO()
+        current.save(buf, format="WEBP", quality=quality, method=4)
+        thumbs[str(size)] = buf.getvalue()
+    return thumbs
+
+
+def open_for_thumbnails(image_bytes: bytes, sizes=THUMBNAIL_SIZES) -> Image.Image:
+    """Decode just large enough for the biggest thumbnail (JPEG draft mode)."""
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.format == "JPEG" and sizes:
+        img.draft("RGB", (max(sizes), max(sizes)))
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
+def thumbnails_from_bytes(image_bytes: bytes, sizes=THUMBNAIL_SIZES, quality: int = THUMBNAIL_QUALITY) -> dict[str, bytes]:
+    return make_thumbnails(open_for_thumbnails(image_bytes, sizes), sizes, quality)
@@ -0,0 +1,150 @@
+"""
+Exercise the explanation HTTP client against local stand-in services:
+
+  * latency of a new ClientSession per call (old behaviour) vs the pooled keep-alive session
+  * a hung service hitting the read timeout
+  * a flaky service (every other request answers 500) recovered by retries
+  * a service that is down opening the circuit breaker, then failing fast
+  * a service answering garbled 200 bodies: counted as failures, and a failed
+    half-open trial re-opens the circuit instead of leaving it stuck
+
+    python -m benchmarks.bench_explain_client --calls 200
+"""
+import argparse
+import asyncio
+import base64
+import socket
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+from app.utils.http_client import CircuitBreaker, CircuitOpen, HttpClientPool, ServiceError
+
+PAYLOAD = {"shap_base64": base64.b64encode(b"\x89PNG" + b"\0" * 2048).decode()}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _start_stand_ins(hang_s: float) -> tuple[web.AppRunner, int]:
+    flaky_calls = 0
+
+    async def ok(request):
+        await request.read()
+        return web.json_response(PAYLOAD)
+
+    async def hang(request):
+        await request.read()
+        await asyncio.sleep(hang_s)
+        return web.json_response(PAYLOAD)
+
+    async def flaky(request):
+        nonlocal flaky_calls
+        await request.read()
+        flaky_calls += 1
+        if flaky_calls % 2:
+            return web.Response(status=500)
+        return web.json_response(PAYLOAD)
+
+    async def garbled(request):
+        await request.read()
+        return web.Response(status=200, text="<html>upstream proxy error</html>", content_type="application/json")
+
+    app = web.Application(client_max_size=32 * 1024 ** 2)
+    app.router.add_post("/ok", ok)
+    app.router.add_post("/hang", hang)
+    app.router.add_post("/flaky", flaky)
+    app.router.add_post("/garbled", garbled)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = _free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, port
+
+
+async def _session_per_call(url: str, data: bytes):
+    async with aiohttp.ClientSession() as session:
+        form = aiohttp.FormData()
+        form.add_field("file", data, filename="scan.jpg", content_type="image/jpeg")
+        async with session.post(url, data=form) as resp:
+            return await resp.json()
+
+
+async def _timed(fn, calls: int) -> list[float]:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def main(calls: int, image_kb: int):
+    runner, port = await _start_stand_ins(hang_s=5.0)
+    base = f"http://127.0.0.1:{port}"
+    data = b"\xff\xd8" + b"\0" * (image_kb * 1024)
+    pool = HttpClientPool(limit=8)
+    try:
+        ok = pool.service("ok", f"{base}/ok")
+        old = await _timed(lambda: _session_per_call(f"{base}/ok", data), calls)
+        new = await _timed(lambda: ok.post_file(data), calls)
+        print(f"{calls} calls, {image_kb} KB image")
+        print(f"  session per call: median {statistics.median(old):6.2f} ms")
+        print(f"  pooled session:   median {statistics.median(new):6.2f} ms")
+
+        hung = pool.service("hang", f"{base}/hang", read_timeout_s=0.5, retries=0)
+        start = time.perf_counter()
+        try:
+            await hung.post_file(data)
+        except ServiceError as e:
+            print(f"hung service: gave up after {time.perf_counter() - start:.2f}s ({e})")
+
+        flaky = pool.service("flaky", f"{base}/flaky", retries=2, backoff_s=0.05)
+        results = await asyncio.gather(*(flaky.post_file(data) for _ in range(10)), return_exceptions=True)
+        print(f"flaky service: {sum(not isinstance(r, Exception) for r in results)}/10 succeeded, "
+              f"{flaky.retried} retries")
+
+        down = pool.service("down", f"http://127.0.0.1:{_free_port()}/explain", retries=1, backoff_s=0.05,
+                            breaker=CircuitBreaker(failure_threshold=3, reset_timeout_s=60))
+        outcomes = []
+        for _ in range(6):
+            start = time.perf_counter()
+            try:
+                await down.post_file(data)
+            except CircuitOpen:
+                outcomes.append(f"open {(time.perf_counter() - start) * 1000:.2f}ms")
+            except ServiceError:
+                outcomes.append(f"error {(time.perf_counter() - start) * 1000:.2f}ms")
+        print(f"down service: {', '.join(outcomes)}")
+
+        garbled = pool.service("garbled", f"{base}/garbled", retries=0,
+                               breaker=CircuitBreaker(failure_threshold=1, reset_timeout_s=0.2))
+        outcomes = []
+        for _ in range(3):
+            await asyncio.sleep(0.25)  # past the reset timeout: each call is a half-open trial
+            try:
+                await garbled.post_file(data)
+            except CircuitOpen:
+                outcomes.append("open")
+            except ServiceError:
+                outcomes.append("error")
+        print(f"garbled service: {', '.join(outcomes)} (every trial is let through, none gets stuck)")
+
+        for name, stats in pool.stats().items():
+            print(f"  {name:6s} {stats}")
+    finally:
+        await pool.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=256)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.image_kb))
@@ -0,0 +1,169 @@
+"""
+Exercise the explanation job queue (JobWorker + MemoryJobStore):
+
+  * deduplication: enqueueing a key that is queued or running is a no-op
+  * retry with exponential backoff until the handler succeeds
+  * a job that keeps failing is marked failed after max_attempts
+  * lease renewal: a job running longer than its lease is not run twice
+  * a job whose worker died mid-run is picked up by another worker
+  * throughput of no-op jobs at a given concurrency
+
+Exits non-zero if any check fails.
+
+    python -m benchmarks.bench_job_queue --jobs 500 --concurrency 8
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+
+from app.utils.job_queue import JobWorker, MemoryJobStore
+
+FAILURES = []
+
+
+def check(name: str, ok: bool, detail: str = ""):
+    print(f"  [{'ok' if ok else 'FAIL'}] {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        FAILURES.append(name)
+
+
+async def wait_for_status(store, key: str, statuses: tuple, timeout_s: float = 10.0) -> dict:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        job = await store.get(key)
+        if job and job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.02)
+    return await store.get(key)
+
+
+def worker(store, handler, **kwargs) -> JobWorker:
+    options = dict(concurrency=1, poll_interval_s=0.02, lease_s=5.0, max_attempts=5, backoff_base_s=0.1)
+    return JobWorker(store, handler, **{**options, **kwargs})
+
+
+async def dedup():
+    print("deduplication")
+    store = MemoryJobStore()
+    runs = Counter()
+
+    async def handler(job):
+        runs[job["_id"]] += 1
+        await asyncio.sleep(0.2)
+
+    w = worker(store, handler)
+    check("first enqueue queues", await w.enqueue("scan-1", {}))
+    check("enqueue while queued is a no-op", not await w.enqueue("scan-1", {}))
+    w.start()
+    await wait_for_status(store, "scan-1", ("running",))
+    check("enqueue while running is a no-op", not await w.enqueue("scan-1", {}))
+    await wait_for_status(store, "scan-1", ("done",))
+    check("enqueue after done queues again", await w.enqueue("scan-1", {}))
+    await wait_for_status(store, "scan-1", ("done",))
+    await w.stop()
+    check("handler ran once per queued job", runs["scan-1"] == 2, f"ran {runs['scan-1']}x")
+
+
+async def retry_backoff():
+    print("retry with backoff")
+    store = MemoryJobStore()
+    started = []
+
+    async def flaky(job):
+        started.append(time.monotonic())
+        if len(started) < 3:
+            raise RuntimeError("explainer unavailable")
+
+    w = worker(store, flaky, backoff_base_s=0.1)
+    await w.enqueue("scan-2", {})
+    w.start()
+    job = await wait_for_status(store, "scan-2", ("done", "failed"))
+    await w.stop()
+    gaps = [b - a for a, b in zip(started, started[1:])]
+    check("succeeds on the third attempt", job["status"] == "done" and job["attempts"] == 3,
+          f"{job['status']} after {job['attempts']} attempts")
+    check("backoff doubles between attempts", len(gaps) == 2 and gaps[0] >= 0.1 and gaps[1] >= 0.2,
+          ", ".join(f"{g:.2f}s" for g in gaps))
+
+    async def broken(job):
+        raise RuntimeError("always fails")
+
+    w = worker(store, broken, max_attempts=3, backoff_base_s=0.02)
+    await w.enqueue("scan-3", {})
+    w.start()
+    job = await wait_for_status(store, "scan-3", ("done", "failed"))
+    await w.stop()
+    check("marked failed after max_attempts", job["status"] == "failed" and job["attempts"] == 3,
+          f"{job['status']} after {job['attempts']} attempts, last_error={job['last_error']!r}")
+
+
+async def leases():
+    print("leases")
+    store = MemoryJobStore()
+    runs = Counter()
+
+    async def slow(job):
+        runs[job["_id"]] += 1
+        await asyncio.sleep(1.0)  # more than three lease periods
+
+    a, b = worker(store, slow, lease_s=0.3), worker(store, slow, lease_s=0.3)
+    await a.enqueue("scan-4", {})
+    a.start()
+    await wait_for_status(store, "scan-4", ("running",))
+    b.start()
+    job = await wait_for_status(store, "scan-4", ("done",))
+    await asyncio.gather(a.stop(), b.stop())
+    check("job longer than its lease runs once", job["status"] == "done" and runs["scan-4"] == 1,
+          f"ran {runs['scan-4']}x, {job['attempts']} attempts")
+
+    # a worker that dies mid-job stops renewing; another picks the job up once the lease expires
+    crashed = worker(store, slow, lease_s=0.3)
+    await crashed.enqueue("scan-5", {})
+    crashed.start()
+    await wait_for_status(store, "scan-5", ("running",))
+    await crashed.stop()
+    rescuer = worker(store, slow, lease_s=0.3)
+    rescuer.start()
+    job = await wait_for_status(store, "scan-5", ("done",))
+    await rescuer.stop()
+    check("job of a dead worker is taken over", job["status"] == "done" and job["worker"] == rescuer.worker_id,
+          f"{job['attempts']} attempts")
+
+
+async def throughput(jobs: int, concurrency: int):
+    print(f"throughput ({jobs} no-op jobs, concurrency {concurrency})")
+    store = MemoryJobStore()
+
+    async def noop(job):
+        await asyncio.sleep(0)
+
+    w = worker(store, noop, concurrency=concurrency)
+    for i in range(jobs):
+        await store.enqueue(f"scan-{i}", {}, w.max_attempts)
+    start = time.perf_counter()
+    w.start()
+    while (await store.counts())["done"] < jobs:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    await w.stop()
+    print(f"  {jobs / elapsed:.0f} jobs/s")
+
+
+async def main(jobs: int, concurrency: int):
+    await dedup()
+    await retry_backoff()
+    await leases()
+    await throughput(jobs, concurrency)
+    if FAILURES:
+        print(f"{len(FAILURES)} check(s) failed: {', '.join(FAILURES)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.jobs, args.concurrency))
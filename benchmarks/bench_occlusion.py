@@ -0,0 +1,46 @@
+"""
+Occlusion explainer latency versus scoring batch size, using the real model.
+
+    python -m benchmarks.bench_occlusion --window 8 --stride 4 --runs 5
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app.ml_model import INPUT_SHAPE, predict_local, registry
+from app.occlusion import occlusion_map, render_heatmap, window_masks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--stride", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64, 128, 256, 512])
+    args = parser.parse_args()
+
+    registry.get()
+    rng = np.random.default_rng(0)
+    img = rng.uniform(0, 255, INPUT_SHAPE).astype(np.float32)
+    n_windows = len(window_masks(INPUT_SHAPE[0], INPUT_SHAPE[1], args.window, args.stride))
+    print(f"model {registry.version}, window {args.window}, stride {args.stride}: {n_windows} occluded variants")
+
+    for batch_size in args.batch_sizes:
+        occlusion_map(img, predict_local, window=args.window, stride=args.stride, batch_size=batch_size)  # warm-up
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            heat, _ = occlusion_map(img, predict_local, window=args.window, stride=args.stride, batch_size=batch_size)
+            timings.append((time.perf_counter() - start) * 1000)
+        calls = -(-n_windows // batch_size) + 1
+        print(f"  batch {batch_size:4d}: {calls:4d} model calls, median {statistics.median(timings):8.1f} ms")
+
+    start = time.perf_counter()
+    png = render_heatmap(img, heat)
+    print(f"  render: {(time.perf_counter() - start) * 1000:.1f} ms, {len(png) / 1024:.1f} KB PNG")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare the old upload preprocessing path (write temp file, full decode,
+resize) with the in-memory draft-mode path.
+
+    python -m benchmarks.bench_preprocess --width 4032 --height 3024 --runs 30
+"""
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from PIL import Image
+
+from app.ml_model import preprocess_image, preprocess_image_bytes
+
+
+def make_photo(width: int, height: int, fmt: str) -> bytes:
+    # smooth gradient + noise compresses like a real photo, unlike pure noise
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx * 255 / width, yy * 255 / height, (xx + yy) * 127 / (width + height)], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format=fmt, quality=92)
+    return buf.getvalue()
+
+
+def old_path(image_bytes: bytes, tmp_dir: str):
+    temp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}_scan.jpg")
+    with open(temp_path, "wb") as f:
+        f.write(image_bytes)
+    tensor = preprocess_image(temp_path)
+    os.remove(temp_path)
+    return tensor
+
+
+def new_path(image_bytes: bytes, tmp_dir: str):
+    return preprocess_image_bytes(image_bytes)
+
+
+def bench(fn, image_bytes: bytes, runs: int, tmp_dir: str) -> list[float]:
+    fn(image_bytes, tmp_dir)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(image_bytes, tmp_dir)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--runs", type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fmt in ("JPEG", "PNG"):
+            image_bytes = make_photo(args.width, args.height, fmt)
+            old = bench(old_path, image_bytes, args.runs, tmp_dir)
+            new = bench(new_path, image_bytes, args.runs, tmp_dir)
+
+            diff = np.abs(old_path(image_bytes, tmp_dir) - new_path(image_bytes, tmp_dir))
+            print(f"{fmt} {args.width}x{args.height} ({len(image_bytes) / 1e6:.1f} MB)")
+            print(f"  temp file + full decode : median {statistics.median(old):7.2f} ms")
+            print(f"  in-memory draft decode  : median {statistics.median(new):7.2f} ms "
+                  f"({statistics.median(old) / statistics.median(new):.1f}x)")
+            print(f"  mean abs pixel diff     : {diff.mean():.2f} / 255")
+
+
+if __name__ == "__main__":
+    main()
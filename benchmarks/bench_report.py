@@ -0,0 +1,82 @@
+"""
+PDF report size and render time with the original images embedded versus
+images resampled for their box (REPORT_IMAGE_DPI / REPORT_IMAGE_QUALITY).
+Uses a synthetic phone-camera photo and matplotlib-sized explanation PNGs.
+
+    python -m benchmarks.bench_report --width 4032 --height 3024 --runs 10
+"""
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.reports import REPORT_IMAGE_DPI, REPORT_IMAGE_QUALITY
+from app.utils import pdf_generator
+from app.utils.pdf_generator import render_pdf_report
+
+
+def _photo(width: int, height: int) -> bytes:
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([(xx * 255 // width), (yy * 255 // height), ((xx + yy) * 255 // (width + height))], axis=-1)
+    noise = rng.integers(0, 24, (height, width, 3))
+    buf = io.BytesIO()
+    Image.fromarray((base + noise).clip(0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+def _explanation_png(size: tuple[int, int], seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    heat = rng.random((size[1] // 8, size[0] // 8, 3))
+    img = Image.fromarray((heat * 255).astype(np.uint8)).resize(size, Image.BICUBIC).convert("RGBA")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _time(fn, runs: int) -> tuple[float, bytes]:
+    timings, out = [], b""
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--dpi", type=int, default=REPORT_IMAGE_DPI)
+    parser.add_argument("--quality", type=int, default=REPORT_IMAGE_QUALITY)
+    args = parser.parse_args()
+
+    user = {"name": "Bench User", "email": "bench@example.com"}
+    scan = {
+        "patient_name": "Alice Roy", "patient_age": 34, "gender": "Female", "scan_area": "Forearm",
+        "additional_info": "benchmark", "prediction": {"class": "nv", "confidence": 0.91, "readable_name": "Melanocytic Nevi"},
+        "image_bytes": _photo(args.width, args.height),
+        "explanation_images": {"shap": _explanation_png((1000, 800), 1), "occlusion": _explanation_png((1000, 800), 2)},
+    }
+    inputs = len(scan["image_bytes"]) + sum(len(v) for v in scan["explanation_images"].values())
+    print(f"inputs: {args.width}x{args.height} photo + 2 explanation PNGs, {inputs / 1e6:.2f} MB")
+
+    ms, pdf = _time(lambda: render_pdf_report(user, scan, image_dpi=0, image_quality=args.quality), args.runs)
+    print(f"  original images:      {len(pdf) / 1e6:7.3f} MB, median {ms:8.1f} ms")
+
+    pdf_generator._resampled.clear()
+    start = time.perf_counter()
+    pdf = render_pdf_report(user, scan, image_dpi=args.dpi, image_quality=args.quality)
+    cold = (time.perf_counter() - start) * 1000
+    print(f"  resampled, cold:      {len(pdf) / 1e6:7.3f} MB, {cold:8.1f} ms  ({args.dpi} dpi, quality {args.quality})")
+
+    ms, pdf = _time(lambda: render_pdf_report(user, scan, image_dpi=args.dpi, image_quality=args.quality), args.runs)
+    print(f"  resampled, cached:    {len(pdf) / 1e6:7.3f} MB, median {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()